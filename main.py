@@ -1,4 +1,4 @@
-from src import getUrls, downloadRepos, RefactoringMining, DiffMining, TLOCMining, DevelopperEffort, BugFixing
+from src import getUrls, downloadRepos, Pipeline
 import os
 import time
 
@@ -9,8 +9,7 @@ if not os.path.exists('results'):
 
 # getUrls.run()
 # downloadRepos.run()
-RefactoringMining.run()
-DiffMining.run()
-TLOCMining.run()
-DevelopperEffort.run()
-BugFixing.run()
\ No newline at end of file
+
+# Clone, refactoring mining, diff mining, TLOC, effort and issues of every project,
+# run concurrently where the stage dependencies and the machine allow it
+Pipeline.run()
@@ -0,0 +1,99 @@
+import subprocess
+
+from src import LOCCache, GitService
+from src.Languages import language_of
+
+NULL_SHA = "0" * 40
+
+# Symlinks and submodules are not counted by scc
+IGNORED_MODES = {"120000", "160000"}
+
+# In-memory memo in front of the persistent blob_lines table of the LOC cache
+_blob_lines = {}
+
+def list_changed_blobs(repo_path, previous_hash, commit_hash):
+    """
+    List (path, old blob, new blob) for every file changed between two commits, without any checkout.
+    The old blob is None for added files and the new blob is None for deleted files
+    """
+    result = subprocess.run(
+        ['git', 'diff-tree', '-r', '-z', '--no-renames', previous_hash, commit_hash],
+        cwd=repo_path,
+        capture_output=True
+    )
+    if result.returncode != 0:
+        print(f"[git diff-tree error] : {commit_hash} : {result.stderr.decode(errors='replace')}")
+        return None
+
+    # -z output is ":<old mode> <new mode> <old sha> <new sha> <status>\0<path>\0" for every file
+    fields = result.stdout.split(b'\0')
+    changed_blobs = []
+    for i in range(0, len(fields) - 1, 2):
+        old_mode, new_mode, old_sha, new_sha, _ = fields[i].decode().lstrip(':').split(' ')
+        path = fields[i + 1].decode(errors='replace')
+
+        old_blob = old_sha if old_sha != NULL_SHA and old_mode not in IGNORED_MODES else None
+        new_blob = new_sha if new_sha != NULL_SHA and new_mode not in IGNORED_MODES else None
+        changed_blobs.append((path, old_blob, new_blob))
+
+    return changed_blobs
+
+def count_lines(content):
+    """
+    Count lines the way scc does, binary files are skipped
+    """
+    if b'\0' in content[:10000]:
+        return 0
+    lines = content.count(b'\n')
+    if content and not content.endswith(b'\n'):
+        lines += 1
+    return lines
+
+def read_blob_lines(repo_path, blob_shas):
+    """
+    Count the lines of blobs read straight from the object store by the repo's git cat-file process
+    """
+    blobs = GitService.read_objects(repo_path, blob_shas)
+    for sha in blob_shas:
+        if sha not in blobs:
+            print(f"[Missing blob] : {sha}")
+
+    return {sha: count_lines(content) for sha, content in blobs.items()}
+
+def get_blob_lines(repo_path, blob_shas):
+    """
+    Return {blob sha: lines}, reading only the blobs that were never counted before
+    """
+    missing = {sha for sha in blob_shas if sha not in _blob_lines}
+    if missing:
+        _blob_lines.update(LOCCache.load_blob_lines(missing))
+        missing = {sha for sha in missing if sha not in _blob_lines}
+    if missing:
+        counted = read_blob_lines(repo_path, sorted(missing))
+        LOCCache.save_blob_lines(counted)
+        _blob_lines.update(counted)
+
+    return {sha: _blob_lines.get(sha, 0) for sha in blob_shas}
+
+def diff_loc(repo_path, previous_hash, commit_hash, programming_languages):
+    """
+    Return loc(commit) - loc(previous commit) for the given languages, or None if git failed.
+    Unchanged files cancel out, so only the blobs of the changed files are counted
+    """
+    changed_blobs = list_changed_blobs(repo_path, previous_hash, commit_hash)
+    if changed_blobs is None:
+        return None
+
+    old_blobs = []
+    new_blobs = []
+    for path, old_blob, new_blob in changed_blobs:
+        if language_of(path) not in programming_languages:
+            continue
+        if old_blob:
+            old_blobs.append(old_blob)
+        if new_blob:
+            new_blobs.append(new_blob)
+
+    blob_lines = get_blob_lines(repo_path, old_blobs + new_blobs)
+
+    return sum(blob_lines[sha] for sha in new_blobs) - sum(blob_lines[sha] for sha in old_blobs)
@@ -1,80 +1,425 @@
 import requests
+import asyncio
 import json
 import time
 import os
+from urllib.parse import urlparse, parse_qs
+from datetime import datetime
 
-def check_github_its(owner, repo, token):
-    url = f"https://api.github.com/repos/{owner}/{repo}/issues"
-    headers = {
-        "Authorization": f"token {token}"
-    }
-    response = requests.get(url, headers=headers)
+GITHUB_API = "https://api.github.com"
+# Requests in flight at once, shared by all the repos being mined
+MAX_CONCURRENT_REQUESTS = 8
+# Retries of a request that failed for another reason than the rate limit (server errors, secondary rate limits)
+MAX_RETRIES = 3
+
+class TokenPool:
+    """
+    GitHub tokens, each request uses the one with the most requests left in its rate limit window
+    """
+
+    def __init__(self, tokens):
+        self.tokens = list(tokens) or [""]
+        # Unknown until the first response, assume a full window
+        self.remaining = {token: None for token in self.tokens}
+        self.reset = {token: 0 for token in self.tokens}
+
+    def pick(self, cost=1):
+        """
+        Return a token with at least cost requests (or GraphQL points) left, or None if there is none
+        """
+        now = time.time()
+        for token in self.tokens:
+            if self.remaining[token] is not None and self.remaining[token] < cost and self.reset[token] <= now:
+                self.remaining[token] = None
+
+        available = [token for token in self.tokens if self.remaining[token] is None or self.remaining[token] >= cost]
+        if not available:
+            return None
+        return max(available, key=lambda token: float("inf") if self.remaining[token] is None else self.remaining[token])
+
+    def update(self, token, headers):
+        if "X-RateLimit-Remaining" in headers:
+            self.remaining[token] = int(headers["X-RateLimit-Remaining"])
+        if "X-RateLimit-Reset" in headers:
+            self.reset[token] = int(headers["X-RateLimit-Reset"])
+
+    def wait_time(self):
+        return max(1, min(self.reset.values()) - int(time.time()) + 1)
+
+def open_session(max_concurrent=MAX_CONCURRENT_REQUESTS):
+    """
+    Session keeping up to max_concurrent connections alive, shared by all the requests
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=max_concurrent, pool_maxsize=max_concurrent)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+async def fetch(session, semaphore, tokens, url, params=None, etag=None):
+    """
+    GET url with the best token of the pool, waiting for a reset only when every token is exhausted.
+    With etag, an unchanged response comes back as a 304, which is not counted in the rate limit.
+    Server errors and secondary rate limits are retried MAX_RETRIES times
+    """
+    attempt = 0
+    while True:
+        token = tokens.pick()
+        if token is None:
+            sleep_time = tokens.wait_time()
+            print(f"Rate limit exceeded on every token. Sleeping for {sleep_time} seconds")
+            await asyncio.sleep(sleep_time)
+            continue
+
+        headers = {"Authorization": f"token {token}"} if token else {}
+        if etag:
+            headers["If-None-Match"] = etag
+        async with semaphore:
+            # requests is blocking, every request runs in its own thread
+            response = await asyncio.to_thread(session.get, url, headers=headers, params=params, timeout=60)
+        tokens.update(token, response.headers)
+
+        # Retry with another token
+        if response.status_code in (403, 429) and response.headers.get("X-RateLimit-Remaining") == "0":
+            continue
+        if response.status_code in (403, 429) or response.status_code >= 500:
+            if attempt < MAX_RETRIES:
+                attempt += 1
+                await asyncio.sleep(retry_delay(response, attempt))
+                continue
+        return response
+
+def retry_delay(response, attempt):
+    """
+    Seconds to wait before retrying a failed request, as asked by GitHub or with an exponential backoff
+    """
+    retry_after = response.headers.get("Retry-After", "")
+    return int(retry_after) if retry_after.isdigit() else 2 ** attempt
+
+def last_page(response):
+    """
+    Number of the last page from the Link header, 1 if there is a single page
+    """
+    last = response.links.get("last")
+    if not last:
+        return 1
+    return int(parse_qs(urlparse(last["url"]).query).get("page", ["1"])[0])
+
+def sync_state_path(results_dir, owner, repo):
+    return f'{results_dir}/{owner}_{repo}/{repo}_issues_sync.json'
+
+def load_sync_state(results_dir, owner, repo):
+    """
+    Stored issues and sync state of a repo, (None, None) if it was never mined
+    """
+    issues_file = f'{results_dir}/{owner}_{repo}/{repo}_issues.json'
+    if not os.path.exists(issues_file) or not os.path.exists(sync_state_path(results_dir, owner, repo)):
+        return None, None
+
+    with open(issues_file, 'r') as f:
+        issues_data = json.load(f)
+    with open(sync_state_path(results_dir, owner, repo), 'r') as f:
+        sync_state = json.load(f)
+    return issues_data, sync_state
+
+def save_sync_state(results_dir, owner, repo, since, etag):
+    with open(sync_state_path(results_dir, owner, repo), 'w') as f:
+        json.dump({"since": since, "etag": etag}, f, indent=4)
+
+def save_no_issues(results_dir, owner, repo):
+    """
+    Write an empty issues file for a project without GitHub issues, so it counts as mined.
+    Issues mined before are kept
+    """
+    issues_file = f'{results_dir}/{owner}_{repo}/{repo}_issues.json'
+    if not os.path.exists(issues_file):
+        with open(issues_file, 'w') as f:
+            json.dump([], f)
+
+def merge_issues(issues_data, updated_issues):
+    """
+    Replace the stored issues that were updated, by id, and put the new ones first like GitHub does
+    """
+    updated = {issue["id"]: issue for issue in updated_issues}
+    merged = [updated.pop(issue["id"], issue) for issue in issues_data]
+    return [issue for issue in updated_issues if issue["id"] in updated] + merged
+
+async def mine_github_issues_async(session, semaphore, tokens, owner, repo, results_dir, base_url=GITHUB_API,
+                                   incremental=True):
+    """
+    Mine all the issues of a repo, fetching every page at once once the first one gives the page count.
+    The first page also tells if the project uses github as ITS. Return the issues, or None if it doesn't.
+    In incremental mode, a repo mined before only asks for the issues updated since its last sync
+    """
+    url = f"{base_url}/repos/{owner}/{repo}/issues"
+    params = {"state": "all", "per_page": 100}
+
+    stored_issues, sync_state = load_sync_state(results_dir, owner, repo) if incremental else (None, None)
+    etag = None
+    if sync_state is not None:
+        params["since"] = sync_state["since"]
+        etag = sync_state["etag"]
+
+    first_page = await fetch(session, semaphore, tokens, url, {**params, "page": 1}, etag)
+
+    if sync_state is not None:
+        # Nothing changed since the last sync
+        if first_page.status_code == 304 or (first_page.status_code == 200 and not first_page.json()):
+            if first_page.status_code == 200:
+                save_sync_state(results_dir, owner, repo, sync_state["since"], first_page.headers.get("ETag"))
+            print(f"[Issues up to date] : {repo}.")
+            return stored_issues
 
     # If 404, project isn't using Github as ITS
-    if response.status_code == 404:
+    if first_page.status_code == 404:
         print(f"{repo} not using github as ITS.")
-        return False
-    elif response.status_code == 200 and response.json():
-        print(f"{repo} using gitHub as ITS.")
-        return True
-    else:
-        print(f"[Error getting ITS info] : {repo}.")
-        return False
+        save_no_issues(results_dir, owner, repo)
+        return None
+    elif first_page.status_code != 200:
+        # The issues mined before are kept, but the project is not up to date
+        raise Exception(f"getting ITS info of {repo} failed with status {first_page.status_code}")
+    elif not first_page.json():
+        print(f"{repo} has no issues on github.")
+        save_no_issues(results_dir, owner, repo)
+        return None
+    print(f"{repo} using gitHub as ITS.")
+
+    pages = await asyncio.gather(*(
+        fetch(session, semaphore, tokens, url, {**params, "page": page})
+        for page in range(2, last_page(first_page) + 1)
+    ))
+
+    issues_data = list(first_page.json())
+    for page in pages:
+        if page.status_code != 200:
+            # Nothing is written and the previous sync point is kept, the missing issues are fetched next time
+            raise Exception(f"getting an issues page of {repo} failed with status {page.status_code}")
+        issues_data.extend(page.json())
 
-def mine_github_issues(owner, repo, token, results_dir):
+    if stored_issues is not None:
+        print(f"[Issues updated] : {repo} : {len(issues_data)}")
+        issues_data = merge_issues(stored_issues, issues_data)
+
+    with open(f'{results_dir}/{owner}_{repo}/{repo}_issues.json', 'w') as f:
+        json.dump(issues_data, f, indent=4)
+
+    # The next sync starts from the most recent update GitHub returned, so the local clock never matters.
+    # The same since is sent again until something changes, which keeps the stored ETag valid
+    since = max(issue["updated_at"] for issue in issues_data)
+    etag = first_page.headers.get("ETag") if since == params.get("since") else None
+    save_sync_state(results_dir, owner, repo, since, etag)
+    
+    print(f"[Issues extracted] : {repo}.")
+    return issues_data
+
+# Issues with what bug-fix linking needs, 100 per query (the maximum of a GraphQL connection).
+# Pull requests are not returned, unlike the REST issues endpoint
+ISSUES_QUERY = """
+query($owner: String!, $repo: String!, $cursor: String, $since: DateTime) {
+  rateLimit { cost remaining resetAt }
+  repository(owner: $owner, name: $repo) {
+    issues(first: 100, after: $cursor, filterBy: {since: $since}, orderBy: {field: CREATED_AT, direction: DESC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        id databaseId number title body state stateReason url createdAt updatedAt closedAt
+        author { login }
+        comments { totalCount }
+        labels(first: 20) { nodes { name } }
+        closedByPullRequestsReferences(first: 5, includeClosedPrs: true) {
+          nodes { number url merged mergeCommit { oid } }
+        }
+        timelineItems(last: 5, itemTypes: [CLOSED_EVENT]) {
+          nodes { ... on ClosedEvent { closer { __typename ... on Commit { oid } ... on PullRequest { number } } } }
+        }
+      }
+    }
+  }
+}
+"""
+
+async def post_graphql(session, semaphore, tokens, base_url, variables, cost):
     """
-    Mine issues from a github repo that uses github as ITS
+    Run ISSUES_QUERY with a token that still has cost points left in its GraphQL rate limit
     """
-    url = f"https://api.github.com/repos/{owner}/{repo}/issues"
-    headers = {
-        "Authorization": f"token {token}"
+    while True:
+        token = tokens.pick(cost)
+        if token is None:
+            sleep_time = tokens.wait_time()
+            print(f"GraphQL points exhausted on every token. Sleeping for {sleep_time} seconds")
+            await asyncio.sleep(sleep_time)
+            continue
+
+        headers = {"Authorization": f"bearer {token}"} if token else {}
+        async with semaphore:
+            response = await asyncio.to_thread(session.post, f"{base_url}/graphql", headers=headers,
+                                               json={"query": ISSUES_QUERY, "variables": variables}, timeout=120)
+        tokens.update(token, response.headers)
+
+        if response.status_code in (403, 429) and response.headers.get("X-RateLimit-Remaining") == "0":
+            continue
+        if response.status_code != 200:
+            raise Exception(f"GraphQL request failed with status {response.status_code}")
+
+        payload = response.json()
+        rate_limit = (payload.get("data") or {}).get("rateLimit")
+        if rate_limit:
+            # The points left are more precise than the headers
+            tokens.remaining[token] = rate_limit["remaining"]
+            tokens.reset[token] = int(datetime.fromisoformat(rate_limit["resetAt"].replace("Z", "+00:00")).timestamp())
+        return payload
+
+def graphql_issue_to_rest(node):
+    """
+    Convert an issue of ISSUES_QUERY to the shape of the REST API, plus the pull requests and commits that closed it
+    """
+    closing_commits = []
+    for event in node["timelineItems"]["nodes"]:
+        closer = (event or {}).get("closer") or {}
+        if closer.get("__typename") == "Commit":
+            closing_commits.append(closer["oid"])
+
+    return {
+        "id": node["databaseId"],
+        "node_id": node["id"],
+        "number": node["number"],
+        "title": node["title"],
+        "body": node["body"],
+        "state": node["state"].lower(),
+        "state_reason": node["stateReason"].lower() if node["stateReason"] else None,
+        "html_url": node["url"],
+        "user": {"login": node["author"]["login"]} if node["author"] else None,
+        "labels": [{"name": label["name"]} for label in node["labels"]["nodes"]],
+        "comments": node["comments"]["totalCount"],
+        "created_at": node["createdAt"],
+        "updated_at": node["updatedAt"],
+        "closed_at": node["closedAt"],
+        "closing_pull_requests": [
+            {
+                "number": pr["number"],
+                "html_url": pr["url"],
+                "merged": pr["merged"],
+                "merge_commit_sha": pr["mergeCommit"]["oid"] if pr["mergeCommit"] else None
+            }
+            for pr in node["closedByPullRequestsReferences"]["nodes"]
+        ],
+        "closing_commits": closing_commits,
     }
-    issues_data = []
-    page = 1
 
+async def mine_github_issues_graphql(session, semaphore, tokens, owner, repo, results_dir, base_url=GITHUB_API,
+                                     incremental=True):
+    """
+    Same as mine_github_issues_async with the GraphQL API: one query per 100 issues brings their labels,
+    closing pull requests and closing commits, which would need several REST calls per issue
+    """
+    stored_issues, sync_state = load_sync_state(results_dir, owner, repo) if incremental else (None, None)
+    variables = {"owner": owner, "repo": repo, "cursor": None,
+                 "since": sync_state["since"] if sync_state is not None else None}
+
+    issues_data = []
+    # Points needed by the next query, the cost of the previous one is the best estimate
+    cost = 1
     while True:
-        params = {"state": "all", "per_page": 100, "page": page}
-        response = requests.get(url, headers=headers, params=params)
-
-        # Check limit rate of api
-        if response.status_code == 403 and "X-RateLimit-Remaining" in response.headers and response.headers["X-RateLimit-Remaining"] == "0":
-            reset_time = int(response.headers["X-RateLimit-Reset"])
-            sleep_time = reset_time - int(time.time()) + 1
-            print(f"Rate limit exceeded. Sleeping for {sleep_time} seconds")
-            time.sleep(sleep_time)
-            continue
-        
-        if response.status_code != 200 or not response.json():
-            break
+        payload = await post_graphql(session, semaphore, tokens, base_url, variables, cost)
+
+        data = payload.get("data") or {}
+        if data.get("repository") is None:
+            errors = payload.get("errors") or []
+            if any(error.get("type") == "NOT_FOUND" for error in errors):
+                print(f"{repo} not using github as ITS.")
+                save_no_issues(results_dir, owner, repo)
+                return None
+            raise Exception(f"getting the issues of {repo} failed: {errors}")
+
+        if data.get("rateLimit"):
+            cost = data["rateLimit"]["cost"]
 
-        issues_data.extend(response.json())
-        page += 1
+        issues = data["repository"]["issues"]
+        issues_data.extend(graphql_issue_to_rest(node) for node in issues["nodes"])
 
-        # Exit if less than 100 issues, wich means it was the last page
-        if len(response.json()) < 100:
+        if not issues["pageInfo"]["hasNextPage"]:
             break
+        variables["cursor"] = issues["pageInfo"]["endCursor"]
+
+    if stored_issues is not None:
+        if not issues_data:
+            print(f"[Issues up to date] : {repo}.")
+            return stored_issues
+        print(f"[Issues updated] : {repo} : {len(issues_data)}")
+        issues_data = merge_issues(stored_issues, issues_data)
+    elif not issues_data:
+        print(f"{repo} has no issues on github.")
+        save_no_issues(results_dir, owner, repo)
+        return None
 
     with open(f'{results_dir}/{owner}_{repo}/{repo}_issues.json', 'w') as f:
         json.dump(issues_data, f, indent=4)
-    
+
+    # There is no ETag on GraphQL queries
+    save_sync_state(results_dir, owner, repo, max(issue["updated_at"] for issue in issues_data), None)
+
     print(f"[Issues extracted] : {repo}.")
     return issues_data
 
-def run():
-    # Github token
-    token = ""
+async def mine_projects(projects, tokens, results_dir="results", base_url=GITHUB_API,
+                        max_concurrent=MAX_CONCURRENT_REQUESTS, incremental=True, backend="rest", raise_errors=False):
+    """
+    Mine the issues of several owner_repo projects at once over one pool of connections.
+    backend is "rest" or "graphql". Return {project: issues or None}, a project that failed is None
+    unless raise_errors, which raises its error instead
+    """
+    mine = mine_github_issues_graphql if backend == "graphql" else mine_github_issues_async
 
-    results_dir="results"
+    session = open_session(max_concurrent)
+    semaphore = asyncio.Semaphore(max_concurrent)
+    try:
+        results = await asyncio.gather(*(
+            mine(session, semaphore, tokens, *project.split('_', 1), results_dir, base_url, incremental)
+            for project in projects
+        ), return_exceptions=True)
+    finally:
+        session.close()
+
+    issues = {}
+    for project, result in zip(projects, results):
+        if isinstance(result, Exception):
+            if raise_errors:
+                raise result
+            print(f"[Error mining issues] : {project} : {result}")
+            result = None
+        issues[project] = result
+    return issues
 
-    for project in os.listdir(results_dir):
+def get_tokens(token=""):
+    """
+    Tokens from the comma separated GITHUB_TOKENS variable, or the given token
+    """
+    tokens = [t.strip() for t in os.environ.get("GITHUB_TOKENS", "").split(",") if t.strip()]
+    return TokenPool(tokens or [token])
 
-        owner, repo = project.split('_')
-            
-        if check_github_its(owner, repo, token):
-            issues_data = mine_github_issues(owner, repo, token, results_dir)
-            print(f"Issues mined: {len(issues_data)}")
+def report(issues):
+    for project, issues_data in issues.items():
+        if issues_data is not None:
+            print(f"Issues mined for {project}: {len(issues_data)}")
         else:
-            print("No issues found")
+            print(f"No issues found for {project}")
+
+# Raise if the issues of the project could not all be mined, so that the pipeline marks it as failed
+def run_project(project, token="", results_dir="results", base_url=GITHUB_API, incremental=True, backend="rest"):
+    report(asyncio.run(mine_projects([project], get_tokens(token), results_dir, base_url,
+                                     incremental=incremental, backend=backend, raise_errors=True)))
+
+# With incremental, repos mined before only download the issues updated since their last sync.
+# The graphql backend also brings the closing pull requests and commits of every issue
+def run(base_url=GITHUB_API, incremental=True, backend="rest"):
+    # Github token, used if GITHUB_TOKENS is not set
+    token = ""
+
+    results_dir="results"
+
+    # Only projects named owner_repo can be looked up on GitHub
+    projects = [project for project in os.listdir(results_dir) if '_' in project]
+    report(asyncio.run(mine_projects(projects, get_tokens(token), results_dir, base_url,
+                                     incremental=incremental, backend=backend)))
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,289 @@
+import os
+import csv
+import json
+import logging
+import subprocess
+import time
+from collections import defaultdict
+
+from src import BlobLOC, CommitTable, FileChangesTable, TLOCMining, DevelopperEffort
+from src.DiffMining import (RECORD_SEPARATOR, FIELD_SEPARATOR, NUMSTAT_FORMAT, unquote_path, parse_numstat_record,
+                            write_commits_json)
+from src.Languages import language_of
+
+class CommitEvent:
+    """
+    One commit of the traversal: its metadata, the blobs it changed (from --raw) and its diff stats (from --numstat).
+    Merges are diffed against their first parent
+    """
+
+    def __init__(self, record):
+        self.sha, parents, self.author, self.date, self.message, stats = record.split(FIELD_SEPARATOR, 5)
+        self.parents = parents.split()
+
+        # --raw lines come first and start with ':', the --numstat and --summary lines follow
+        self.raw = []
+        numstat = []
+        for line in stats.split('\n'):
+            if line.startswith(':'):
+                self.raw.append(line)
+            else:
+                numstat.append(line)
+        self.numstat_record = FIELD_SEPARATOR.join([self.sha, parents, self.author, self.date, self.message,
+                                                    '\n'.join(numstat)])
+
+    @property
+    def previous_sha(self):
+        return self.parents[0] if self.parents else None
+
+    def changed_blobs(self):
+        """
+        (old path, old blob, new path, new blob) for every changed file, blobs are None when there is no content
+        """
+        for line in self.raw:
+            # ":<old mode> <new mode> <old sha> <new sha> <status>\t<path>[\t<new path>]"
+            header, *paths = line.split('\t')
+            old_mode, new_mode, old_blob, new_blob, _ = header.lstrip(':').split(' ')
+            old_path = unquote_path(paths[0])
+            new_path = unquote_path(paths[-1])
+
+            old_blob = old_blob if old_blob != BlobLOC.NULL_SHA and old_mode not in BlobLOC.IGNORED_MODES else None
+            new_blob = new_blob if new_blob != BlobLOC.NULL_SHA and new_mode not in BlobLOC.IGNORED_MODES else None
+            yield old_path, old_blob, new_path, new_blob
+
+def traverse_events(repo_path, shas=None, stats=True):
+    """
+    Stream a CommitEvent for every commit of the repo from a single git log pass.
+    With shas, only these commits are read. Without stats, git does not compute the --numstat and --summary
+    of the commits, which costs far more than the --raw lines
+    """
+    command = ['git', 'log', '--raw', '--no-abbrev', '--diff-merges=first-parent', NUMSTAT_FORMAT]
+    command += ['--numstat', '--summary'] if stats else []
+    command += ['--no-walk=unsorted', '--stdin'] if shas is not None else ['--all']
+
+    process = subprocess.Popen(
+        command,
+        cwd=repo_path,
+        stdin=subprocess.PIPE if shas is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        encoding='utf-8',
+        errors='replace'
+    )
+    if shas is not None:
+        # git reads all the commits before it starts writing, so stdin can be written at once
+        process.stdin.write("".join(f"{sha}\n" for sha in shas))
+        process.stdin.close()
+
+    buffer = ''
+    try:
+        for data in iter(lambda: process.stdout.read(1 << 20), ''):
+            records = (buffer + data).split(RECORD_SEPARATOR)
+            buffer = records.pop()
+            for record in records:
+                if record:
+                    yield CommitEvent(record)
+        if buffer:
+            yield CommitEvent(buffer)
+    finally:
+        process.stdout.close()
+        process.wait()
+
+def walk(repo_path, analyzers, shas=None, stats=True):
+    """
+    Send every commit of the repo (or only shas) to all the analyzers, then let them write their results.
+    Return the number of commits
+    """
+    commit_count = 0
+    for event in traverse_events(repo_path, shas, stats):
+        for analyzer in analyzers:
+            analyzer.on_commit(event)
+        commit_count += 1
+
+    for analyzer in analyzers:
+        analyzer.finish()
+    return commit_count
+
+class DiffStatsAnalyzer:
+    """
+    CommitsDiff records, same as the stats-only DiffMining traversal (merges have no record)
+    """
+
+    def __init__(self, result_dir_path):
+        self.result_dir_path = result_dir_path
+        self.jsonl_path = os.path.join(result_dir_path, 'CommitsDiff.jsonl')
+        self.jsonl_file = open(self.jsonl_path + '.tmp', 'w', encoding='utf-8')
+
+    def on_commit(self, event):
+        if len(event.parents) > 1:
+            return
+        record = parse_numstat_record(event.numstat_record)
+        if record:
+            self.jsonl_file.write(json.dumps(record) + '\n')
+
+    def finish(self):
+        self.jsonl_file.close()
+        os.replace(self.jsonl_path + '.tmp', self.jsonl_path)
+        write_commits_json(self.jsonl_path, os.path.join(self.result_dir_path, 'CommitsDiff.json'))
+        FileChangesTable.export_file_changes(self.jsonl_path,
+                                             os.path.join(self.result_dir_path, 'CommitsDiffFiles.parquet'))
+
+class RefactoringTLOCAnalyzer:
+    """
+    TLOC of the refactoring commits, counted from the blobs they changed like TLOCMining's "blobs" mode.
+    The blobs of all the commits are read in one batch, the first time the TLOC is asked for.
+    The analyzers writing results from it share one instance
+    """
+
+    def __init__(self, refactoring_results_path, repo_path):
+        with open(refactoring_results_path, 'r') as f:
+            self.refactoring_commits = [commit for commit in json.load(f).get('commits', []) if commit.get('sha1')]
+        self.repo_path = repo_path
+        self.wanted = {commit['sha1'] for commit in self.refactoring_commits}
+        # sha -> (previous sha, author, new blobs, old blobs)
+        self.changes = {}
+        # Author of every refactoring commit, including root commits that have no TLOC
+        self.authors = {}
+        self._tlocs = None
+
+    def on_commit(self, event):
+        if event.sha not in self.wanted:
+            return
+        self.authors[event.sha] = event.author
+        if not event.parents:
+            return
+
+        old_blobs = []
+        new_blobs = []
+        for old_path, old_blob, new_path, new_blob in event.changed_blobs():
+            if old_blob and language_of(old_path) in TLOCMining.PROGRAMMING_LANGUAGES:
+                old_blobs.append(old_blob)
+            if new_blob and language_of(new_path) in TLOCMining.PROGRAMMING_LANGUAGES:
+                new_blobs.append(new_blob)
+        self.changes[event.sha] = (event.previous_sha, event.author, new_blobs, old_blobs)
+
+    def finish(self):
+        pass
+
+    def tlocs(self):
+        """
+        Return {sha: (tloc, previous sha, author)} for the refactoring commits that were traversed
+        """
+        if self._tlocs is None:
+            blob_lines = BlobLOC.get_blob_lines(
+                self.repo_path, [sha for _, _, new, old in self.changes.values() for sha in new + old]
+            )
+            self._tlocs = {
+                sha: (abs(sum(blob_lines[blob] for blob in new) - sum(blob_lines[blob] for blob in old)),
+                      previous, author)
+                for sha, (previous, author, new, old) in self.changes.items()
+            }
+        return self._tlocs
+
+class TLOCAnalyzer:
+    """
+    TLOC_mining.csv, one row per refactoring commit
+    """
+
+    def __init__(self, refactoring_tloc, output_csv_path):
+        self.refactoring_tloc = refactoring_tloc
+        self.output_csv_path = output_csv_path
+
+    def on_commit(self, event):
+        pass
+
+    def finish(self):
+        tlocs = self.refactoring_tloc.tlocs()
+        with open(self.output_csv_path, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=['refactoring_hash', 'previous_hash', 'author', 'TLOC'])
+            writer.writeheader()
+            for commit in self.refactoring_tloc.refactoring_commits:
+                tloc, previous_hash, author = tlocs.get(commit['sha1'], (0, None, None))
+                writer.writerow({
+                    'refactoring_hash': commit['sha1'],
+                    'previous_hash': previous_hash if previous_hash else 'N/A',
+                    'author': author if author else 'Unknown',
+                    'TLOC': tloc
+                })
+
+class EffortAnalyzer:
+    """
+    DeveloperEffort_mining.json, the TLOC of the refactoring commits summed by author and by refactoring type
+    """
+
+    def __init__(self, refactoring_tloc, output_file):
+        self.refactoring_tloc = refactoring_tloc
+        self.output_file = output_file
+
+    def on_commit(self, event):
+        pass
+
+    def finish(self):
+        tlocs = self.refactoring_tloc.tlocs()
+        authors = self.refactoring_tloc.authors
+        developer_effort = defaultdict(int)
+        refactoring_effort = defaultdict(int)
+
+        for commit in self.refactoring_tloc.refactoring_commits:
+            tloc = tlocs.get(commit['sha1'], (0, None, None))[0]
+            author = DevelopperEffort.get_results_author(commit) or authors.get(commit['sha1']) or 'Unknown'
+
+            developer_effort[author] += tloc
+            for refactoring in commit.get('refactorings', []):
+                refactoring_effort[refactoring['type']] += tloc
+
+        with open(self.output_file, 'w') as outfile:
+            json.dump({
+                'developer_effort': dict(developer_effort),
+                'refactoring_effort': dict(refactoring_effort)
+            }, outfile, indent=4)
+
+def run_project(project, diff=True, repos_dir="repos", results_dir="results"):
+    """
+    Produce CommitsDiff (stats only), TLOC_mining.csv and DeveloperEffort_mining.json of a project in one traversal.
+    TLOC and effort need the RefactoringMiner results, without them only the diffs are mined.
+    diff=False leaves CommitsDiff to DiffMining, e.g. when it keeps the diff bodies. The traversal then only
+    reads the --raw lines of the refactoring commits.
+    The TLOC is counted from the changed blobs like TLOCMining's "blobs" mode, not with scc
+    """
+    repo_path = os.path.join(repos_dir, project)
+    result_dir_path = os.path.join(results_dir, project)
+    if not os.path.isdir(repo_path):
+        return
+    os.makedirs(result_dir_path, exist_ok=True)
+
+    analyzers = [DiffStatsAnalyzer(result_dir_path)] if diff else []
+
+    refactoring_results = os.path.join(result_dir_path, "ListOfRefactoringCommits.json")
+    if os.path.exists(refactoring_results):
+        # TLOC and effort are written from the same TLOC, counted once
+        refactoring_tloc = RefactoringTLOCAnalyzer(refactoring_results, repo_path)
+        analyzers.append(refactoring_tloc)
+        analyzers.append(TLOCAnalyzer(refactoring_tloc, os.path.join(result_dir_path, "TLOC_mining.csv")))
+        analyzers.append(EffortAnalyzer(refactoring_tloc, os.path.join(result_dir_path, "DeveloperEffort_mining.json")))
+
+    if not analyzers:
+        logging.info(f"[Commit events] : {project} : nothing to mine")
+        return
+
+    shas = None
+    if not diff:
+        # Unknown shas would make git log fail on all the others
+        shas = list(CommitTable.get_commits(repo_path, refactoring_tloc.wanted, project))
+
+    start = time.time()
+    commit_count = walk(repo_path, analyzers, shas, stats=diff)
+    logging.info(f"[Commit events] : {project} : {commit_count} commits, {len(analyzers)} analyzers "
+                 f"in {time.time() - start:.1f}s")
+
+def run():
+    logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+    repos_dir = "repos"
+
+    for project in os.listdir(repos_dir):
+        run_project(project, repos_dir=repos_dir)
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import subprocess
+
+from src import GitService, LOCCache
+
+TABLE_DIR = os.path.join("cache", "commit_tables")
+
+# Fields of every commit, separated by \x1f, commits separated by \x1e (the subject may contain anything else)
+LOG_FORMAT = "%H%x1f%P%x1f%an%x1f%ae%x1f%ai%x1f%ci%x1f%s%x1e"
+COLUMNS = ["sha", "parents", "author_name", "author_email", "author_date", "commit_date", "subject"]
+
+# Rows inserted per transaction while streaming git log
+INSERT_BATCH = 10000
+# Shas per SELECT, below SQLite's limit of bound parameters
+SELECT_BATCH = 500
+
+# One connection per process and table, refreshed the first time it is opened by the process
+_connections = {}
+
+def table_path(project, table_dir=TABLE_DIR):
+    return os.path.join(table_dir, f"{project}.sqlite")
+
+def open_table(project, table_dir=TABLE_DIR):
+    key = (os.getpid(), table_path(project, table_dir))
+    if key in _connections:
+        return _connections[key]
+
+    os.makedirs(table_dir, exist_ok=True)
+    connection = sqlite3.connect(table_path(project, table_dir), timeout=60)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS commits (
+            sha TEXT PRIMARY KEY,
+            parents TEXT NOT NULL,
+            author_name TEXT,
+            author_email TEXT,
+            author_date TEXT,
+            commit_date TEXT,
+            subject TEXT
+        )"""
+    )
+    # Ref tips the table was built from, the next refresh only reads the commits that are not reachable from them
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS tips (
+            sha TEXT PRIMARY KEY
+        )"""
+    )
+    connection.commit()
+
+    _connections[key] = connection
+    return connection
+
+def list_tips(repo_path):
+    result = subprocess.run(['git', 'for-each-ref', '--format=%(objectname)'], cwd=repo_path,
+                            capture_output=True, text=True)
+    tips = set(result.stdout.split())
+    head = GitService.get_commit(repo_path, 'HEAD')
+    if head:
+        tips.add(head["sha"])
+    return tips
+
+def refresh(connection, repo_path):
+    """
+    Add the commits of the repo that are not in the table yet, with a single streamed git log.
+    Only the history that is not reachable from the tips of the previous refresh is read
+    """
+    tips = list_tips(repo_path)
+    known_tips = {sha for (sha,) in connection.execute("SELECT sha FROM tips")}
+    if tips == known_tips:
+        return 0
+
+    # Tips that disappeared (e.g. after a force push and a gc) cannot be excluded anymore
+    known_tips = set(GitService.get_commits(repo_path, sorted(known_tips)))
+
+    process = subprocess.Popen(
+        ['git', 'log', '--all', '--stdin', f'--format={LOG_FORMAT}'],
+        cwd=repo_path,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    process.stdin.write("".join(f"^{sha}\n" for sha in known_tips).encode())
+    process.stdin.close()
+
+    added = 0
+    rows = []
+    buffer = b""
+    for block in iter(lambda: process.stdout.read(1 << 16), b""):
+        records = (buffer + block).split(b"\x1e")
+        buffer = records.pop()
+        for record in records:
+            fields = record.strip(b"\n").decode('utf-8', errors='replace').split("\x1f")
+            if len(fields) == len(COLUMNS):
+                rows.append(fields)
+
+        if len(rows) >= INSERT_BATCH:
+            added += insert_rows(connection, rows)
+            rows = []
+    added += insert_rows(connection, rows)
+
+    if process.wait() != 0:
+        # Keep the previous tips so the next refresh reads this history again
+        print(f"[git log error] : {repo_path}")
+        return added
+
+    with connection:
+        connection.execute("DELETE FROM tips")
+        connection.executemany("INSERT INTO tips (sha) VALUES (?)", [(sha,) for sha in tips])
+    return added
+
+def insert_rows(connection, rows):
+    with connection:
+        connection.executemany(
+            f"INSERT OR REPLACE INTO commits ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows
+        )
+    return len(rows)
+
+def get_table(repo_path, project=None, table_dir=TABLE_DIR):
+    """
+    Commit table of a repo, brought up to date the first time a process uses it.
+    project names the table, worktrees of a repo must pass the project of the repo
+    """
+    project = project or LOCCache.repo_key(repo_path)
+    key = (os.getpid(), table_path(project, table_dir))
+    if key not in _connections:
+        added = refresh(open_table(project, table_dir), repo_path)
+        if added:
+            print(f"[Commit table] : {added} commits added for {project}")
+    return _connections[key]
+
+def get_commits(repo_path, shas, project=None):
+    """
+    Return {sha: commit} for the given full shas, commits that are not in the table are left out
+    """
+    connection = get_table(repo_path, project)
+    shas = list(dict.fromkeys(shas))
+
+    commits = {}
+    for i in range(0, len(shas), SELECT_BATCH):
+        batch = shas[i:i + SELECT_BATCH]
+        rows = connection.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM commits WHERE sha IN ({', '.join('?' * len(batch))})", batch
+        )
+        for row in rows:
+            commit = dict(zip(COLUMNS, row))
+            commit["parents"] = commit["parents"].split()
+            commits[commit["sha"]] = commit
+    return commits
+
+def get_commit(repo_path, sha, project=None):
+    return get_commits(repo_path, [sha], project).get(sha)
+
+def get_first_parent(repo_path, sha, project=None):
+    """
+    Same as git rev-parse <sha>^1, falling back to git for anything that is not a known full sha
+    """
+    commit = get_commit(repo_path, sha, project)
+    if commit is None:
+        return GitService.get_first_parent(repo_path, sha)
+    return commit["parents"][0] if commit["parents"] else None
+
+def get_author(repo_path, sha, project=None):
+    """
+    Same as git log -1 --pretty=%an <sha>
+    """
+    commit = get_commit(repo_path, sha, project)
+    if commit is None:
+        return GitService.get_author(repo_path, sha)
+    return commit["author_name"]
+
+def get_authors(repo_path, shas, project=None):
+    """
+    Return {sha: author name} for the given shas
+    """
+    authors = {sha: commit["author_name"] for sha, commit in get_commits(repo_path, shas, project).items()}
+    missing = [sha for sha in shas if sha not in authors]
+    if missing:
+        authors.update({sha: commit["author"] for sha, commit in GitService.get_commits(repo_path, missing).items()})
+    return authors
+
+def get_commit_dates(repo_path, shas, project=None):
+    """
+    Return {sha: committer date formatted like %ci} for the given shas
+    """
+    dates = {sha: commit["commit_date"] for sha, commit in get_commits(repo_path, shas, project).items()}
+    missing = [sha for sha in shas if sha not in dates]
+    if missing:
+        dates.update(GitService.get_commit_dates(repo_path, missing))
+    return dates
@@ -3,41 +3,42 @@ import subprocess
 import json
 from collections import defaultdict
 
+from src import LOCCache, BlobLOC, WorktreePool, CommitTable, NumstatLOC
 
+# Shorten list of programming languages since we struggles to compute data, so we considered to cut some programming languages
+PROGRAMMING_LANGUAGES = {
+    'Java', 'Python', 'C++', 'C#', 'JavaScript', 'PHP', 'C', 'R', 'Swift', 
+    'Go', 'Rust', 'Ruby', 'Kotlin', 'TypeScript'
+}
 
 def run_scc(repo_path):
     """
     Executes scc and return the TLOC by programming language for a repository
     """
+    languages = LOCCache.run_scc_languages(repo_path)
+    if languages is None:
+        return 0
+    return LOCCache.filter_loc(languages, PROGRAMMING_LANGUAGES)
 
-    # Shorten list of programming languages since we struggles to compute data, so we considered to cut some programming languages
-    PROGRAMMING_LANGUAGES = {
-    'Java', 'Python', 'C++', 'C#', 'JavaScript', 'PHP', 'C', 'R', 'Swift', 
-    'Go', 'Rust', 'Ruby', 'Kotlin', 'TypeScript'
-}
+def get_commit_loc(repo_path, commit_hash, project=None, sparse=False):
+    """
+    Return the LOC of a commit from the LOC cache shared with TLOCMining, counting it with scc on a miss.
+    Counts of a sparse checkout are cached apart from the full ones
+    """
+    project = project or LOCCache.repo_key(repo_path)
 
-    try:
-        result = subprocess.run(
-            ['scc', '--no-cocomo', '--no-complexity', '--format', 'json', repo_path],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
-        languages_data = json.loads(result.stdout)
-        
-        total_loc = 0
-        for lang_data in languages_data:
-            if lang_data.get('Name') in PROGRAMMING_LANGUAGES:
-                total_loc += lang_data.get('Lines', 0)
-                
-        return total_loc
-    except subprocess.CalledProcessError as e:
-        print(f"Eror executing scc: {e}")
-        return 0
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON from scc: {e}")
-        return 0
+    languages = LOCCache.load_languages(project, commit_hash)
+    if languages is None and sparse:
+        languages = LOCCache.load_languages(LOCCache.sparse_key(project), commit_hash)
+    if languages is None:
+        if not checkout_commit(repo_path, commit_hash):
+            return None
+        languages = LOCCache.run_scc_languages(repo_path)
+        if languages is None:
+            return 0
+        LOCCache.save_languages(LOCCache.sparse_key(project) if sparse else project, commit_hash, languages)
+
+    return LOCCache.filter_loc(languages, PROGRAMMING_LANGUAGES)
 
 def checkout_commit(repo_path, commit_hash):
     """
@@ -59,49 +60,69 @@ def checkout_commit(repo_path, commit_hash):
         print(f"Checkout error: {e}")
         return False
 
-def get_previous_commit(repo_path, commit_hash):
-    try:
-        result = subprocess.run(
-            ['git', 'rev-parse', f'{commit_hash}^1'],
-            cwd=repo_path,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        if result.returncode != 0:
-            print(f"Error getting previous commit: {result.stderr}")
-            return None
-        return result.stdout.strip()
-    except subprocess.SubprocessError as e:
-        print(f"Error with command git rev-parse: {e}")
-        return None
+def get_previous_commit(repo_path, commit_hash, project=None):
+    """
+    First parent of a commit, from the commit table of the project
+    """
+    previous_hash = CommitTable.get_first_parent(repo_path, commit_hash, project)
+    if previous_hash is None:
+        print(f"Error getting previous commit: {commit_hash}")
+    return previous_hash
 
-def analyze_commit_effort(repo_path, commit_hash):
+def analyze_commit_effort(repo_path, commit_hash, project=None, tloc_mode="scc", sparse=False):
     """
     Compute TLOC for a specific commit
     """
-    # Checkout refactoring commit
-    if not checkout_commit(repo_path, commit_hash):
-        return 0
-        
-    current_loc = run_scc(repo_path)
-    
-    # Obtain and checkout the previous commit
-    previous_hash = get_previous_commit(repo_path, commit_hash)
+    # Obtain the previous commit, no checkout is needed for that
+    previous_hash = get_previous_commit(repo_path, commit_hash, project)
     if not previous_hash:
         return 0
-        
-    if not checkout_commit(repo_path, previous_hash):
-        return 0
-        
-    previous_loc = run_scc(repo_path)
+
+    if tloc_mode == "blobs":
+        # Only count the blobs changed by the commit, read from the object store without any checkout
+        loc_delta = BlobLOC.diff_loc(repo_path, previous_hash, commit_hash, PROGRAMMING_LANGUAGES)
+        if loc_delta is None:
+            return 0
+    else:
+        current_loc = get_commit_loc(repo_path, commit_hash, project, sparse)
+        if current_loc is None:
+            return 0
+
+        previous_loc = get_commit_loc(repo_path, previous_hash, project, sparse)
+        if previous_loc is None:
+            return 0
+
+        loc_delta = current_loc - previous_loc
     
     # Return absolute difference between commits
-    return abs(current_loc - previous_loc)
+    return abs(loc_delta)
 
-def analyze_developer_effort(refactoring_results_path, repo_path, output_file):
+def get_results_author(commit):
+    """
+    Author of a commit of the RefactoringMiner results, if they have one
+    """
+    # Try different ways to get the author
+    author = commit.get('authorName')
+    if not author:
+        author = commit.get('author', {}).get('name')
+    if not author:
+        author = commit.get('author')
+    return author
+
+def commit_effort_task(worktree_path, args):
+    """
+    Worker task of the worktree pool, the LOC cache key must stay the project name and not the worktree one
+    """
+    commit_hash, project, tloc_mode, sparse = args
+    return analyze_commit_effort(worktree_path, commit_hash, project, tloc_mode, sparse)
+
+def analyze_developer_effort(refactoring_results_path, repo_path, output_file, tloc_mode="scc",
+                             num_workers=1, worktree_dir=None, sparse=False):
     """
     Analyze dev effort from RMiner and save the results as a json file
+    tloc_mode is either "scc" (checkout and count whole trees), "blobs" (count only the changed blobs)
+    or "numstat" (lines added and deleted by the commits)
+    With num_workers > 1, commits are spread over a pool of git worktrees created in worktree_dir (e.g. /dev/shm)
     """
     try:
         with open(refactoring_results_path, 'r') as f:
@@ -114,42 +135,54 @@ def analyze_developer_effort(refactoring_results_path, repo_path, output_file):
     refactoring_effort = defaultdict(int)
     
     try:
+        # Commits without an author in the results get it from git, all in one batch
+        missing_authors = [commit['sha1'] for commit in data.get('commits', []) if commit.get('sha1')
+                           and not (commit.get('authorName') or commit.get('author'))]
+        git_authors = CommitTable.get_authors(repo_path, missing_authors)
+
+        commits = []
         for commit in data.get('commits', []):
             commit_hash = commit.get('sha1')
             if not commit_hash:
                 continue
             
-            # Try different ways to get the author
-            author = commit.get('authorName')
-            if not author:
-                author = commit.get('author', {}).get('name')
-            if not author:
-                author = commit.get('author')
+            author = get_results_author(commit)
                 
             # If no author, try with git
             if not author:
-                try:
-                    result = subprocess.run(
-                        ['git', 'show', '-s', '--format=%an', commit_hash],
-                        cwd=repo_path,
-                        capture_output=True,
-                        text=True,
-                        check=True
-                    )
-                    author = result.stdout.strip()
-                except subprocess.SubprocessError:
-                    author = 'Unknown'
+                author = git_authors.get(commit_hash, 'Unknown')
                     
             if not author or author == '':
                 author = 'Unknown'
-                
-            tloc = analyze_commit_effort(repo_path, commit_hash)
+
+            commits.append((commit, commit_hash, author))
+
+        if tloc_mode == "numstat":
+            # Line deltas of all the commits from one git log --numstat, no tree is ever counted
+            numstat = NumstatLOC.numstat_tlocs(repo_path, [commit_hash for _, commit_hash, _ in commits],
+                                               PROGRAMMING_LANGUAGES)
+            tlocs = [numstat.get(commit_hash, (0, None))[0] for _, commit_hash, _ in commits]
+        elif num_workers > 1:
+            # Every worker checks out commits in its own worktree, the main clone is never touched
+            project = LOCCache.repo_key(repo_path)
+            tlocs = WorktreePool.run_on_worktrees(
+                repo_path,
+                [(commit_hash, project, tloc_mode, sparse) for _, commit_hash, _ in commits],
+                commit_effort_task,
+                num_workers,
+                worktree_dir,
+                sparse
+            )
+        else:
+            tlocs = [analyze_commit_effort(repo_path, commit_hash, tloc_mode=tloc_mode) for _, commit_hash, _ in commits]
+
+        for (commit, commit_hash, author), tloc in zip(commits, tlocs):
             developer_effort[author] += tloc
             
             for refactoring in commit.get('refactorings', []):
                 refactoring_effort[refactoring['type']] += tloc
 
-        if not checkout_commit(repo_path, 'HEAD'):
+        if tloc_mode == "scc" and num_workers <= 1 and not checkout_commit(repo_path, 'HEAD'):
             print("Impossible to reset repo to HEAD")
 
         # Enregistrer les résultats dans le fichier JSON spécifié
@@ -166,29 +199,35 @@ def analyze_developer_effort(refactoring_results_path, repo_path, output_file):
         
     except Exception as e:
         print(f"Error analyzing: {e}")
-        checkout_commit(repo_path, 'HEAD')
+        if tloc_mode == "scc" and num_workers <= 1:
+            checkout_commit(repo_path, 'HEAD')
         return {'developer_effort': {}, 'refactoring_effort': {}}
 
-def run():
+def run_project(project, tloc_mode="scc", num_workers=1, worktree_dir=None, sparse=False,
+                repos_dir="repos", results_dir="results"):
+    project_path = os.path.join(repos_dir, project)
+    if not os.path.isdir(project_path):
+        return
+        
+    print(f"\nAnalysing effort for {project}...")
+    
+    refactoring_results = os.path.join(results_dir, project, "ListOfRefactoringCommits.json")
+    if not os.path.exists(refactoring_results):
+        print(f"No result for project {project}")
+        return
+        
+    output_json = os.path.join(results_dir, project, "DeveloperEffort_mining.json")
+    results = analyze_developer_effort(refactoring_results, project_path, output_json, tloc_mode,
+                                       num_workers, worktree_dir, sparse)
+    
+    print(f"Results saved : {output_json}")
+
+def run(tloc_mode="scc", num_workers=1, worktree_dir=None, sparse=False):
     repos_dir = "repos"
     results_dir = "results"
     
     for project in os.listdir(repos_dir):
-        project_path = os.path.join(repos_dir, project)
-        if not os.path.isdir(project_path):
-            continue
-            
-        print(f"\nAnalysing effort for {project}...")
-        
-        refactoring_results = os.path.join(results_dir, project, "ListOfRefactoringCommits.json")
-        if not os.path.exists(refactoring_results):
-            print(f"No result for project {project}")
-            continue
-            
-        output_json = os.path.join(results_dir, project, "DeveloperEffort_mining.json")
-        results = analyze_developer_effort(refactoring_results, project_path, output_json)
-        
-        print(f"Results saved : {output_json}")
+        run_project(project, tloc_mode, num_workers, worktree_dir, sparse, repos_dir, results_dir)
 
 if __name__ == "__main__":
     run()
\ No newline at end of file
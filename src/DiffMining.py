@@ -1,8 +1,14 @@
 import json
-from pydriller import Repository
+from pydriller import Repository, Git
 import os
 import logging
 import subprocess
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.DiffStore import DiffSegmentWriter, can_resume, index_path
+from src import FileChangesTable
 
 # Reset git repo at its main branch
 def reset_git_head(repo_path):
@@ -38,134 +44,586 @@ def reset_git_head(repo_path):
                 logging.error(f"Impossible to reset HEAD {repo_path}")
                 return False
 
-def find_repo_diff(repo_path, result_dir_path):
+# Checkpoint (and fsync the JSONL output) every CHECKPOINT_INTERVAL traversed commits
+CHECKPOINT_INTERVAL = 100
+
+def count_commits(repo_path):
+    result = subprocess.run(['git', 'rev-list', '--count', '--all'], cwd=repo_path, capture_output=True, text=True)
+    if result.returncode != 0:
+        return 0
+    return int(result.stdout.strip() or 0)
+
+def commit_exists(repo_path, commit_hash):
+    result = subprocess.run(['git', 'cat-file', '-e', f'{commit_hash}^{{commit}}'], cwd=repo_path, capture_output=True)
+    return result.returncode == 0
+
+def load_checkpoint(checkpoint_file):
+    """
+    Return the last checkpoint of an interrupted run, or None
+    """
+    if not os.path.exists(checkpoint_file):
+        return None
+    try:
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        logging.error(f"[Ignoring malformed checkpoint] : {checkpoint_file}")
+        return None
+
+def save_checkpoint(checkpoint_file, jsonl_file, last_sha, commit_count, diff_store=None):
+    """
+    Make the JSONL output (and diff store) durable, then atomically record how far the traversal went
+    """
+    jsonl_file.flush()
+    os.fsync(jsonl_file.fileno())
+
+    checkpoint = {
+        'last_sha': last_sha,
+        'offset': jsonl_file.tell(),
+        'commit_count': commit_count
+    }
+    if diff_store:
+        diff_store.flush()
+        checkpoint['store_offset'] = diff_store.tell()
+    with open(checkpoint_file + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(checkpoint_file + '.tmp', checkpoint_file)
+
+def analyze_commit(commit, diff_store=None):
     """
-    Analyse difference between commits for a repo
+    Compute the diff stats of a pydriller commit, or None if the commit is ignored.
+    With a diff store, diff bodies are stored there and records only keep a reference to them
     """
-    commits_data = []
+    parents = commit.parents
+    # Check for parent
+    if not parents:
+        logging.debug(f"[Commit ignored (no parent)] : {commit.hash}")
+        return None
     
+    # Get prievious commit hash
+    if hasattr(parents[0], 'hash'):
+        previous_commit_hash = parents[0].hash
+    else:
+        # If parents[0] is a string, its the hash itself
+        previous_commit_hash = parents[0]
+
+    modified_files = list(commit.modified_files)
+    
+    if not modified_files:
+        logging.debug(f"[Commit ignored (no touched file)] {commit.hash}")
+        return None
+
+    total_files_added = 0
+    total_files_deleted = 0
+    total_lines_added = 0
+    total_lines_deleted = 0
+    file_diffs = {}
+
+    # Find diff stats for each modified file and also add them to the total
+    for file in modified_files:
+
+        diff = {}
+
+        change_type = file.change_type.name
+
+        if change_type == "ADD":
+            total_files_added += 1
+        elif change_type == "DELETE":
+            total_files_deleted += 1
+
+        added = 0
+        removed = 0
+
+        if diff_content := file.diff:
+
+            # Same code as pydriller internally, just not doing the same work twice
+            for line in diff_content.replace("\r", "").split("\n"):
+
+                if line.startswith("-") and not line.startswith("---"):
+                    removed += 1
+                elif line.startswith("+") and not line.startswith("+++"):
+                    added += 1
+
+            if diff_store:
+                diff["diff_ref"] = diff_store.put(diff_content)
+            else:
+                diff["diff_content"] = diff_content
+
+        diff["change_type"] = change_type
+        diff["lines_added"] = added
+        diff["lines_deleted"] = removed
+        total_lines_added += added
+        total_lines_deleted += removed
+
+        # Keyed by path, two files of a commit can have the same name
+        file_diffs[file.new_path or file.old_path] = diff
+    
+    # Get diffs statistics
+    diff_stats = {
+        'files_added': total_files_added,
+        'files_deleted': total_files_deleted,
+        'lines_added': total_lines_added,
+        'lines_deleted': total_lines_deleted,
+        'changed': len(modified_files),
+        'file_diffs': file_diffs
+    }
+    
+    return {
+        'commit_hash': commit.hash,
+        'previous_commit_hash': previous_commit_hash,
+        'author': commit.author.name,
+        'date': commit.author_date.isoformat(),
+        'message': commit.msg,
+        'diff_stats': diff_stats
+    }
+
+# Record and field separators of the stats-only git log format
+RECORD_SEPARATOR = '\x1e'
+FIELD_SEPARATOR = '\x1f'
+NUMSTAT_FORMAT = '--format=%x1e%H%x1f%P%x1f%an%x1f%aI%x1f%B%x1f'
+
+class NumstatCommit:
+    """
+    Commit of the stats-only traversal, its record is already built from git log
+    """
+    def __init__(self, hash, record):
+        self.hash = hash
+        self.record = record
+
+def unquote_path(path):
+    """
+    Undo git's C-style quoting of paths with special characters
+    """
+    if path.startswith('"') and path.endswith('"'):
+        return path[1:-1].encode('latin-1', 'backslashreplace').decode('unicode_escape').encode('latin-1').decode('utf-8', 'replace')
+    return path
+
+def renamed_path(path):
+    """
+    Path after a rename written by --numstat as 'old => new' or 'dir/{old => new}/file'
+    """
+    if ' => ' not in path:
+        return path
+    if '{' in path and '}' in path:
+        prefix, rest = path.split('{', 1)
+        middle, suffix = rest.split('}', 1)
+        new = middle.split(' => ', 1)[1]
+        return (prefix + new + suffix).replace('//', '/')
+    return path.split(' => ', 1)[1]
+
+def parse_numstat_record(record):
+    """
+    Build a CommitsDiff record from one commit of the stats-only git log, or None if the commit is ignored.
+    Same rules as analyze_commit: no record for root commits and commits without touched files (merges)
+    """
+    commit_hash, parents, author, date, message, stats = record.split(FIELD_SEPARATOR, 5)
+    parents = parents.split()
+
+    if not parents:
+        logging.debug(f"[Commit ignored (no parent)] : {commit_hash}")
+        return None
+
+    created = set()
+    deleted = set()
+    numstat = []
+    for line in stats.split('\n'):
+        if not line:
+            continue
+        if line.startswith(' create mode '):
+            created.add(unquote_path(line.split(' ', 4)[4]))
+        elif line.startswith(' delete mode '):
+            deleted.add(unquote_path(line.split(' ', 4)[4]))
+        elif '\t' in line:
+            added, removed, path = line.split('\t', 2)
+            numstat.append((added, removed, path))
+
+    if not numstat:
+        logging.debug(f"[Commit ignored (no touched file)] {commit_hash}")
+        return None
+
+    total_files_added = 0
+    total_files_deleted = 0
+    total_lines_added = 0
+    total_lines_deleted = 0
+    file_diffs = {}
+
+    for added, removed, path in numstat:
+        change_type = "RENAME" if ' => ' in path else "MODIFY"
+        path = unquote_path(renamed_path(path))
+
+        if path in created:
+            change_type = "ADD"
+            total_files_added += 1
+        elif path in deleted:
+            change_type = "DELETE"
+            total_files_deleted += 1
+
+        # Binary files are reported as '-', pydriller has no diff for them either
+        added = int(added) if added != '-' else 0
+        removed = int(removed) if removed != '-' else 0
+
+        total_lines_added += added
+        total_lines_deleted += removed
+
+        file_diffs[path] = {
+            "change_type": change_type,
+            "lines_added": added,
+            "lines_deleted": removed
+        }
+
+    return {
+        'commit_hash': commit_hash,
+        'previous_commit_hash': parents[0],
+        'author': author,
+        'date': date,
+        'message': message.strip(),
+        'diff_stats': {
+            'files_added': total_files_added,
+            'files_deleted': total_files_deleted,
+            'lines_added': total_lines_added,
+            'lines_deleted': total_lines_deleted,
+            'changed': len(numstat),
+            'file_diffs': file_diffs
+        }
+    }
+
+def traverse_numstat(repo_path, resume_sha=None):
+    """
+    Stream the history from a single git log --numstat --summary pass, in the same order as traverse_repository
+    """
+    process = subprocess.Popen(
+        ['git', 'log', '--all', '--numstat', '--summary', NUMSTAT_FORMAT],
+        cwd=repo_path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        encoding='utf-8',
+        errors='replace'
+    )
+
+    buffer = ''
     try:
-        # Check if path exists and if it's a git repo
-        if not os.path.exists(os.path.join(repo_path)):
-            logging.error(f"No git repo found in {repo_path}")
-            return
-        
-        # Reset HEAD
-        if not reset_git_head(repo_path):
-            logging.error(f"Unable to analyze {repo_path} - HEAD problem")
-            return
-            
-        # Instanciate Repository object
-        repo = Repository(
-            path_to_repo=repo_path,
-            order='reverse',  # From newer to older
-            include_refs=True
-        )
-        
-        logging.info(f"[Diff mining] : {repo_path}")
-        commit_count = 0
-        
-        # Get all the commits
-        all_commits = list(repo.traverse_commits())
-        total_commits = len(all_commits)
-        logging.info(f"Total amount of commits : {total_commits}")
-        
-        for commit in all_commits:
-            try:
-                parents = commit.parents
-                # Check for parent
-                if not parents:
-                    logging.debug(f"[Commit ignored (no parent)] : {commit.hash}")
+        while True:
+            data = process.stdout.read(1 << 20)
+            buffer += data
+
+            # Every record starts with the separator, the last one may still be incomplete
+            records = buffer.split(RECORD_SEPARATOR)
+            buffer = records.pop() if data else ''
+            if not data and records and not records[-1]:
+                records.pop()
+
+            for record in records:
+                if not record:
                     continue
-                
-                # Get prievious commit hash
-                if hasattr(parents[0], 'hash'):
-                    previous_commit_hash = parents[0].hash
-                else:
-                    # If parents[0] is a string, its the hash itself
-                    previous_commit_hash = parents[0]
-
-                modified_files = list(commit.modified_files)
-                
-                if not modified_files:
-                    logging.debug(f"[Commit ignored (no touched file)] {commit.hash}")
+
+                commit_hash = record.split(FIELD_SEPARATOR, 1)[0]
+                if resume_sha:
+                    if commit_hash == resume_sha:
+                        resume_sha = None
                     continue
 
-                total_files_added = 0
-                total_files_deleted = 0
-                total_lines_added = 0
-                total_lines_deleted = 0
-                file_diffs = {}
+                yield NumstatCommit(commit_hash, record)
 
-                # Find diff stats for each modified file and also add them to the total
-                for file in modified_files:
+            if not data:
+                break
+    finally:
+        process.stdout.close()
+        process.wait()
 
-                    diff = {}
+def analyze_numstat_commit(commit, diff_store=None):
+    return parse_numstat_record(commit.record)
 
-                    change_type = file.change_type.name
+def write_commits_json(jsonl_path, output_file):
+    """
+    Turn the JSONL records into the CommitsDiff.json array, one record in memory at a time
+    """
+    with open(jsonl_path, 'r', encoding='utf-8') as jsonl_file, \
+         open(output_file + '.tmp', 'w', encoding='utf-8') as json_file:
+        json_file.write('[')
+        first = True
+        for line in jsonl_file:
+            line = line.strip()
+            if not line:
+                continue
+            if not first:
+                json_file.write(', ')
+            json_file.write(line)
+            first = False
+        json_file.write(']')
+    os.replace(output_file + '.tmp', output_file)
+
+def list_commits(repo_path):
+    """
+    All commits in the order pydriller traverses them with order='reverse' and include_refs
+    """
+    result = subprocess.run(['git', 'rev-list', '--all'], cwd=repo_path, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Failed to get commits: {result.stderr}")
+    return result.stdout.split()
+
+def traverse_repository(repo_path, resume_sha=None):
+    """
+    Traverse the whole history with pydriller, starting after resume_sha if given
+    """
+    # Instanciate Repository object
+    repo = Repository(
+        path_to_repo=repo_path,
+        order='reverse',  # From newer to older
+        include_refs=True
+    )
+
+    # Commits are traversed lazily, only the current one is kept in memory
+    for commit in repo.traverse_commits():
 
-                    if change_type == "ADD":
-                        total_files_added += 1
-                    elif change_type == "DELETE":
-                        total_files_deleted += 1
+        # Skip everything up to the checkpointed commit, modified files are never computed for them
+        if resume_sha:
+            if commit.hash == resume_sha:
+                resume_sha = None
+            continue
 
-                    added = 0
-                    removed = 0
+        yield commit
 
-                    if diff_content := file.diff:
+def open_git(repo_path, attempts=10):
+    """
+    pydriller writes to .git/config when opening a repository, so workers opening it
+    at the same time can collide on the config lock
+    """
+    for attempt in range(attempts):
+        try:
+            return Git(repo_path)
+        except OSError as e:
+            if attempt == attempts - 1:
+                raise
+            logging.debug(f"[Retrying to open repository] : {repo_path} : {e}")
+            time.sleep(0.1 * (attempt + 1))
 
-                        # Same code as pydriller internally, just not doing the same work twice
-                        for line in diff_content.replace("\r", "").split("\n"):
+def traverse_commit_list(repo_path, commit_hashes, resume_sha=None):
+    """
+    Load the given commits one by one with pydriller, starting after resume_sha if given
+    """
+    if resume_sha:
+        commit_hashes = commit_hashes[commit_hashes.index(resume_sha) + 1:]
 
-                            if line.startswith("-") and not line.startswith("---"):
-                                removed += 1
-                            elif line.startswith("+") and not line.startswith("+++"):
-                                added += 1
-      
-                        diff["diff_content"] = diff_content
+    git = open_git(repo_path)
+    for commit_hash in commit_hashes:
+        yield git.get_commit(commit_hash)
 
-                    diff["lines_added"] = added
-                    diff["lines_deleted"] = removed
-                    total_lines_added += added
-                    total_lines_deleted += removed
+def mine_commits(repo_path, traverse, jsonl_path, checkpoint_path, store_dir, segment="0", total_commits=0,
+                 analyze=analyze_commit):
+    """
+    Stream the records built by analyze() for the commits yielded by traverse(resume_sha) to jsonl_path,
+    checkpointing regularly so that an interrupted run resumes where it stopped.
+    store_dir is the diff store directory, or None to inline the diffs. Returns the number of records
+    """
+    diff_store = None
 
-                    file_diffs[file.filename] = diff
-                
-                # Get diffs statistics
-                diff_stats = {
-                    'files_added': total_files_added,
-                    'files_deleted': total_files_deleted,
-                    'lines_added': total_lines_added,
-                    'lines_deleted': total_lines_deleted,
-                    'changed': len(modified_files),
-                    'file_diffs': file_diffs
-                }
-                
-                commit_info = {
-                    'commit_hash': commit.hash,
-                    'previous_commit_hash': previous_commit_hash,
-                    'author': commit.author.name,
-                    'date': commit.author_date.isoformat(),
-                    'message': commit.msg,
-                    'diff_stats': diff_stats
-                }
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint and not commit_exists(repo_path, checkpoint['last_sha']):
+        logging.error(f"[Checkpoint commit not found, starting over] : {checkpoint['last_sha']}")
+        checkpoint = None
+    if checkpoint and store_dir and not can_resume(store_dir, segment, checkpoint.get('store_offset', float('inf'))):
+        # The records written so far would reference diffs that are gone
+        logging.error(f"[Diff segment missing, starting over] : {segment}")
+        checkpoint = None
+
+    if checkpoint and os.path.exists(jsonl_path):
+        # Drop records written after the last checkpoint, they will be produced again
+        resume_sha = checkpoint['last_sha']
+        commit_count = checkpoint['commit_count']
+        jsonl_file = open(jsonl_path, 'r+b')
+        jsonl_file.truncate(checkpoint['offset'])
+        jsonl_file.seek(checkpoint['offset'])
+        if store_dir:
+            diff_store = DiffSegmentWriter(store_dir, segment, resume_offset=checkpoint.get('store_offset', 0))
+        logging.info(f"[Resuming diff mining] : after {resume_sha} ({commit_count} commits already treated)")
+    else:
+        resume_sha = None
+        commit_count = 0
+        jsonl_file = open(jsonl_path, 'wb')
+        if store_dir:
+            diff_store = DiffSegmentWriter(store_dir, segment)
+
+    traversed = 0
+    with jsonl_file:
+        for commit in traverse(resume_sha):
+            try:
+                commit_info = analyze(commit, diff_store)
                 
-                commits_data.append(commit_info)
-                commit_count += 1
+                if commit_info:
+                    jsonl_file.write((json.dumps(commit_info) + '\n').encode('utf-8'))
+                    commit_count += 1
                 
-                if commit_count % 10 == 0:
-                    logging.info(f"{commit_count}/{total_commits} commits analysed...")
+                    if commit_count % 10 == 0:
+                        logging.info(f"{commit_count}/{total_commits} commits analysed...")
                 
             except Exception as e:
                 logging.error(f"[Error analysing commit] : {commit.hash} : {str(e)}")
-                continue
+
+            traversed += 1
+            if traversed % CHECKPOINT_INTERVAL == 0:
+                save_checkpoint(checkpoint_path, jsonl_file, commit.hash, commit_count, diff_store)
+
+        jsonl_file.flush()
+        os.fsync(jsonl_file.fileno())
+
+    if diff_store:
+        diff_store.close()
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    return commit_count
+
+def mine_commit_range(args):
+    """
+    Worker of the parallel mode: mine one part of the history into its own JSONL file and diff segment
+    """
+    repo_path, parts_dir, store_dir, part, commit_hashes = args
+
+    jsonl_path = os.path.join(parts_dir, f"part_{part}.jsonl")
+    done_path = jsonl_path + ".done"
+    if os.path.exists(done_path):
+        if not store_dir or os.path.exists(index_path(store_dir, part)):
+            return jsonl_path
+        # The records of the part reference a segment that is gone, mine it again
+        logging.error(f"[Diff segment of part {part} missing, mining it again]")
+        os.remove(done_path)
+
+    commit_count = mine_commits(
+        repo_path,
+        lambda resume_sha: traverse_commit_list(repo_path, commit_hashes, resume_sha),
+        jsonl_path,
+        os.path.join(parts_dir, f"part_{part}.checkpoint.json"),
+        store_dir,
+        segment=str(part),
+        total_commits=len(commit_hashes)
+    )
+
+    # Marks the part as complete for a later resume
+    open(done_path, 'w').close()
+    logging.info(f"[Part {part} done] : {commit_count} commits treated")
+    return jsonl_path
+
+def mine_parallel(repo_path, result_dir_path, jsonl_path, store_dir, num_workers):
+    """
+    Split the history into ranges mined in a process pool, then concatenate their records
+    in the same order as the serial traversal
+    """
+    parts_dir = os.path.join(result_dir_path, 'parts')
+    partition_path = os.path.join(parts_dir, 'partition.json')
+    os.makedirs(parts_dir, exist_ok=True)
+
+    # The partition is kept so that a resumed run gives the same ranges to the same parts
+    if os.path.exists(partition_path):
+        with open(partition_path, 'r', encoding='utf-8') as f:
+            ranges = json.load(f)
+    else:
+        commit_hashes = list_commits(repo_path)
+        # More ranges than workers, so that a slow range does not keep the other workers idle
+        range_count = max(1, min(len(commit_hashes), num_workers * 4))
+        range_size = -(-len(commit_hashes) // range_count)
+        ranges = [commit_hashes[i:i + range_size] for i in range(0, len(commit_hashes), range_size)]
+        with open(partition_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(ranges, f)
+        os.replace(partition_path + '.tmp', partition_path)
+
+    logging.info(f"Mining {len(ranges)} ranges of commits with {num_workers} workers...")
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        part_files = list(executor.map(
+            mine_commit_range,
+            [(repo_path, parts_dir, store_dir, part, commit_hashes) for part, commit_hashes in enumerate(ranges)]
+        ))
+
+    # Concatenate the parts in history order
+    commit_count = 0
+    with open(jsonl_path, 'wb') as jsonl_file:
+        for part_file in part_files:
+            with open(part_file, 'rb') as f:
+                for line in f:
+                    jsonl_file.write(line)
+                    commit_count += 1
+        jsonl_file.flush()
+        os.fsync(jsonl_file.fileno())
+
+    # Diff segments stay in the diff store, records reference them
+    shutil.rmtree(parts_dir)
+
+    return commit_count
+
+def find_repo_diff(repo_path, result_dir_path, inline_diffs=False, num_workers=1, stats_only=False):
+    """
+    Analyse difference between commits for a repo.
+    Records are streamed to CommitsDiff.jsonl as they are produced and the last traversed commit
+    is checkpointed, so an interrupted run resumes where it stopped instead of starting over.
+    Unless inline_diffs is set, diff bodies go to the compressed diff store in <result dir>/diffs
+    and can be read back with DiffStore.read_diff.
+    With num_workers > 1, ranges of the history are mined in parallel.
+    With stats_only, the same records without any diff content come from a single git log --numstat pass.
+    It has no diff bodies and is one sequential pass, so it can't be combined with inline_diffs or num_workers > 1
+    """
+    if stats_only and (inline_diffs or num_workers > 1):
+        raise ValueError("stats_only can't be combined with inline_diffs or num_workers > 1")
+
+    jsonl_path = os.path.join(result_dir_path, 'CommitsDiff.jsonl')
+    checkpoint_path = os.path.join(result_dir_path, 'CommitsDiff.checkpoint.json')
+    store_dir = None if inline_diffs else os.path.join(result_dir_path, 'diffs')
+    
+    try:
+        # Check if path exists and if it's a git repo
+        if not os.path.exists(os.path.join(repo_path)):
+            logging.error(f"No git repo found in {repo_path}")
+            return
+        
+        # Reset HEAD
+        if not reset_git_head(repo_path):
+            logging.error(f"Unable to analyze {repo_path} - HEAD problem")
+            return
+
+        os.makedirs(result_dir_path, exist_ok=True)
+        
+        logging.info(f"[Diff mining] : {repo_path}")
         
-        logging.info(f"[Repo analyse done] :  {commit_count} treated.")
+        total_commits = count_commits(repo_path)
+        logging.info(f"Total amount of commits : {total_commits}")
+
+        start = time.time()
+
+        if stats_only:
+            commit_count = mine_commits(
+                repo_path,
+                lambda resume_sha: traverse_numstat(repo_path, resume_sha),
+                jsonl_path,
+                checkpoint_path,
+                None,
+                total_commits=total_commits,
+                analyze=analyze_numstat_commit
+            )
+        elif num_workers > 1:
+            commit_count = mine_parallel(repo_path, result_dir_path, jsonl_path, store_dir, num_workers)
+        else:
+            commit_count = mine_commits(
+                repo_path,
+                lambda resume_sha: traverse_repository(repo_path, resume_sha),
+                jsonl_path,
+                checkpoint_path,
+                store_dir,
+                total_commits=total_commits
+            )
+        
+        elapsed = time.time() - start
+        logging.info(f"[Repo analyse done] :  {commit_count} treated in {elapsed:.1f}s "
+                     f"({total_commits / max(elapsed, 1e-6):.0f} commits/s, {'stats only' if stats_only else 'pydriller'})")
         
         # Save results
         output_file = os.path.join(result_dir_path, 'CommitsDiff.json')
-        with open(output_file, 'w', encoding='utf-8') as json_file:
-            json.dump(commits_data, json_file)
+        write_commits_json(jsonl_path, output_file)
+
+        # Flat one row per (commit, file) table, much faster to query than the nested JSON
+        FileChangesTable.export_file_changes(jsonl_path, os.path.join(result_dir_path, 'CommitsDiffFiles.parquet'))
         
     except Exception as e:
         logging.error(f"[Error analysing repo] : {repo_path} : {str(e)}")
@@ -173,7 +631,22 @@ def find_repo_diff(repo_path, result_dir_path):
         # Reset HEAD
         reset_git_head(repo_path)
 
-def run():
+def run_project(project, num_workers=1, stats_only=False, repos_dir="repos", results_dir="results"):
+    """
+    Mine the diffs of a single project, unless it was already processed
+    """
+    project_path = os.path.join(repos_dir, project)
+    result_dir_path = os.path.join(results_dir, project)
+
+    # Skip projects that were already processed
+    if os.path.exists(os.path.join(result_dir_path, "CommitsDiff.json")):
+        return
+
+    if os.path.isdir(project_path):
+        logging.info(f"\n[Analysing project] : {project}")
+        find_repo_diff(project_path, result_dir_path, num_workers=num_workers, stats_only=stats_only)
+
+def run(num_workers=1, stats_only=False):
     # Logging config
     logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
@@ -185,16 +658,7 @@ def run():
         return
     
     for project in ["ant.git"]:
-        project_path = os.path.join(repos_dir, project)
-        result_dir_path = os.path.join(results_dir, project)
-
-        # Skip projects that were already processed
-        if os.path.exists(os.path.join(result_dir_path, "CommitsDiff.json")):
-            continue
-        
-        if os.path.isdir(project_path):
-            logging.info(f"\n[Analysing project] : {project}")
-            find_repo_diff(project_path, result_dir_path)
+        run_project(project, num_workers, stats_only, repos_dir, results_dir)
 
 if __name__ == "__main__":
     run()
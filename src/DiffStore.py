@@ -0,0 +1,170 @@
+import os
+import mmap
+import hashlib
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Every record of a segment is a header followed by the compressed diff:
+# sha1 of the uncompressed diff, codec, compressed length
+RECORD_HEADER = struct.Struct('>20sBI')
+# Index entries are sorted by sha1 so that a diff can be found by binary search in the mapped file
+INDEX_ENTRY = struct.Struct('>20sQI')
+
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+
+def _compress(data):
+    if zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=3).compress(data)
+    return CODEC_ZLIB, zlib.compress(data, 6)
+
+def _decompress(codec, data):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise Exception("This diff store was written with zstd, install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+def segment_path(store_dir, segment):
+    return os.path.join(store_dir, f"segment_{segment}.pack")
+
+def index_path(store_dir, segment):
+    return os.path.join(store_dir, f"segment_{segment}.idx")
+
+class DiffSegmentWriter:
+    """
+    Append-only segment of compressed, deduplicated diffs.
+    put() returns the reference that CommitsDiff records keep instead of the diff itself
+    """
+
+    def __init__(self, store_dir, segment="0", resume_offset=None):
+        os.makedirs(store_dir, exist_ok=True)
+        self.store_dir = store_dir
+        self.segment = str(segment)
+        self.entries = {}
+
+        path = segment_path(store_dir, self.segment)
+        # Maps of this process would see the segment change under them
+        _unmap(path)
+        _unmap(index_path(store_dir, self.segment))
+        if resume_offset is not None:
+            # Records written before the checkpoint reference diffs of this segment, it can't start over
+            if not can_resume(store_dir, self.segment, resume_offset):
+                raise Exception(f"Diff segment {path} is missing or shorter than its checkpoint ({resume_offset} bytes)")
+            # Drop what was written after the checkpoint and reload the diffs written before it
+            self.file = open(path, 'r+b')
+            self.file.truncate(resume_offset)
+            self._scan(resume_offset)
+            self.file.seek(resume_offset)
+        else:
+            self.file = open(path, 'wb')
+
+    def _scan(self, end):
+        self.file.seek(0)
+        offset = 0
+        while offset < end:
+            digest, _, length = RECORD_HEADER.unpack(self.file.read(RECORD_HEADER.size))
+            offset += RECORD_HEADER.size
+            if offset + length > end:
+                raise Exception(f"Diff segment {segment_path(self.store_dir, self.segment)} is corrupted at {offset}")
+            self.entries[digest] = (offset, length)
+            offset += length
+            self.file.seek(offset)
+
+    def put(self, diff_content):
+        data = diff_content.encode('utf-8')
+        digest = hashlib.sha1(data).digest()
+
+        if digest not in self.entries:
+            codec, compressed = _compress(data)
+            self.file.write(RECORD_HEADER.pack(digest, codec, len(compressed)))
+            self.entries[digest] = (self.file.tell(), len(compressed))
+            self.file.write(compressed)
+
+        offset, length = self.entries[digest]
+        return {'segment': self.segment, 'offset': offset, 'length': length, 'sha1': digest.hex()}
+
+    def tell(self):
+        return self.file.tell()
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        _unmap(segment_path(self.store_dir, self.segment))
+
+    def close(self):
+        """
+        Flush the segment and write its sorted sha1 index
+        """
+        self.flush()
+        self.file.close()
+
+        with open(index_path(self.store_dir, self.segment) + '.tmp', 'wb') as f:
+            for digest in sorted(self.entries):
+                offset, length = self.entries[digest]
+                f.write(INDEX_ENTRY.pack(digest, offset, length))
+        os.replace(index_path(self.store_dir, self.segment) + '.tmp', index_path(self.store_dir, self.segment))
+        _unmap(index_path(self.store_dir, self.segment))
+
+def can_resume(store_dir, segment, offset):
+    """
+    True if the segment still holds the offset bytes written before a checkpoint
+    """
+    path = segment_path(store_dir, str(segment))
+    return os.path.exists(path) and os.path.getsize(path) >= offset
+
+# Memory-mapped segments and indexes, opened once per process.
+# A map is made again when its file changed, e.g. after appends by another process
+_maps = {}
+
+def _unmap(path):
+    _, data = _maps.pop(path, (None, None))
+    if isinstance(data, mmap.mmap):
+        data.close()
+
+def _map(path):
+    stat = os.stat(path)
+    version = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    if path not in _maps or _maps[path][0] != version:
+        _unmap(path)
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                data = b''
+            else:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _maps[path] = (version, data)
+    return _maps[path][1]
+
+def read_diff(store_dir, diff_ref):
+    """
+    Fetch a single diff from its reference, without reading anything else
+    """
+    data = _map(segment_path(store_dir, diff_ref['segment']))
+    offset = diff_ref['offset']
+    codec = data[offset - RECORD_HEADER.size + 20]
+    return _decompress(codec, data[offset:offset + diff_ref['length']]).decode('utf-8')
+
+def find_diff(store_dir, segment, sha1):
+    """
+    Return the reference of a diff from its sha1 with a binary search in the segment index, or None
+    """
+    index = _map(index_path(store_dir, segment))
+    digest = bytes.fromhex(sha1)
+
+    low, high = 0, len(index) // INDEX_ENTRY.size
+    while low < high:
+        middle = (low + high) // 2
+        entry_digest, offset, length = INDEX_ENTRY.unpack_from(index, middle * INDEX_ENTRY.size)
+        if entry_digest == digest:
+            return {'segment': str(segment), 'offset': offset, 'length': length, 'sha1': sha1}
+        if entry_digest < digest:
+            low = middle + 1
+        else:
+            high = middle
+
+    return None
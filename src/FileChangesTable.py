@@ -0,0 +1,109 @@
+import os
+import json
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Rows are written in batches so that the whole table never has to be in memory
+BATCH_SIZE = 65536
+
+# pydriller's ModificationType names. Every batch uses this same dictionary, the Arrow IPC file format
+# does not allow a dictionary to change between batches
+CHANGE_TYPES = ['ADD', 'COPY', 'RENAME', 'DELETE', 'MODIFY', 'UNKNOWN']
+CHANGE_TYPE_CODES = {name: code for code, name in enumerate(CHANGE_TYPES)}
+
+def get_schema():
+    return pa.schema([
+        ('commit_hash', pa.string()),
+        ('path', pa.string()),
+        ('change_type', pa.dictionary(pa.int8(), pa.string())),
+        ('lines_added', pa.int32()),
+        ('lines_deleted', pa.int32()),
+    ])
+
+def _batch(columns):
+    return pa.RecordBatch.from_arrays([
+        pa.array(columns['commit_hash'], pa.string()),
+        pa.array(columns['path'], pa.string()),
+        pa.DictionaryArray.from_arrays(
+            pa.array([CHANGE_TYPE_CODES.get(name, CHANGE_TYPE_CODES['UNKNOWN']) for name in columns['change_type']],
+                     pa.int8()),
+            pa.array(CHANGE_TYPES, pa.string())
+        ),
+        pa.array(columns['lines_added'], pa.int32()),
+        pa.array(columns['lines_deleted'], pa.int32()),
+    ], schema=get_schema())
+
+def _empty_columns():
+    return {name: [] for name in ['commit_hash', 'path', 'change_type', 'lines_added', 'lines_deleted']}
+
+def export_file_changes(jsonl_path, output_path, fmt='parquet'):
+    """
+    Flatten the file_diffs of CommitsDiff.jsonl into one typed row per (commit, file).
+    fmt is 'parquet' or 'arrow' (Arrow IPC file, which can be memory-mapped without any decoding)
+    """
+    if pa is None:
+        logging.warning("pyarrow is not installed, skipping the file changes table")
+        return False
+
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(output_path + '.tmp', get_schema(), compression='zstd')
+        write_batch = writer.write_batch
+    else:
+        sink = pa.OSFile(output_path + '.tmp', 'wb')
+        writer = pa.ipc.new_file(sink, get_schema())
+        write_batch = writer.write_batch
+
+    row_count = 0
+    columns = _empty_columns()
+    completed = False
+    try:
+        with open(jsonl_path, 'r', encoding='utf-8') as jsonl_file:
+            for line in jsonl_file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+
+                for path, diff in record['diff_stats']['file_diffs'].items():
+                    columns['commit_hash'].append(record['commit_hash'])
+                    columns['path'].append(path)
+                    columns['change_type'].append(diff.get('change_type', 'UNKNOWN'))
+                    columns['lines_added'].append(diff['lines_added'])
+                    columns['lines_deleted'].append(diff['lines_deleted'])
+
+                if len(columns['commit_hash']) >= BATCH_SIZE:
+                    row_count += len(columns['commit_hash'])
+                    write_batch(_batch(columns))
+                    columns = _empty_columns()
+
+        if columns['commit_hash']:
+            row_count += len(columns['commit_hash'])
+            write_batch(_batch(columns))
+        completed = True
+    finally:
+        writer.close()
+        if fmt != 'parquet':
+            sink.close()
+        # Never leave a half written table behind
+        if not completed:
+            os.remove(output_path + '.tmp')
+
+    os.replace(output_path + '.tmp', output_path)
+    logging.info(f"[File changes table] : {row_count} rows written to {output_path}")
+    return True
+
+def load_file_changes(path, columns=None):
+    """
+    Memory-map a file changes table and read only the given columns, as a pyarrow Table (use .to_pandas())
+    """
+    if path.endswith('.parquet'):
+        return pq.read_table(path, columns=columns, memory_map=True)
+
+    # The table keeps the mapping alive, its columns point straight into the file
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return table.select(columns) if columns else table
@@ -0,0 +1,162 @@
+import os
+import re
+import atexit
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+# Objects requested before their answers are read. Small enough that the requests always fit in the pipe,
+# so git never blocks on its stdin while we are still writing
+BATCH_SIZE = 64
+
+# One git cat-file --batch process per (process, repo), reused for every lookup
+_processes = {}
+# Parsed commit headers, by (repo, sha). Other revisions such as HEAD or branches can move,
+# so they are resolved again every time
+_commits = {}
+
+FULL_SHA = re.compile(r"[0-9a-f]{40}")
+
+class CatFile:
+    """
+    Long-lived git cat-file --batch process answering object lookups over a pipe
+    """
+
+    def __init__(self, repo_path):
+        self.process = subprocess.Popen(
+            ['git', 'cat-file', '--batch'],
+            cwd=repo_path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+
+    def read(self, revisions):
+        """
+        Return {revision: (sha, type, content)}, without the revisions that do not name an object
+        """
+        objects = {}
+        for i in range(0, len(revisions), BATCH_SIZE):
+            batch = revisions[i:i + BATCH_SIZE]
+            self.process.stdin.write("".join(f"{revision}\n" for revision in batch).encode())
+            self.process.stdin.flush()
+
+            for revision in batch:
+                # Header is "<sha> <type> <size>", or "<revision> missing" / "<revision> ambiguous"
+                header = self.process.stdout.readline().split()
+                if len(header) != 3:
+                    continue
+
+                content = self.process.stdout.read(int(header[2]))
+                self.process.stdout.read(1)
+                objects[revision] = (header[0].decode(), header[1].decode(), content)
+        return objects
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+def get_cat_file(repo_path):
+    key = (os.getpid(), os.path.abspath(repo_path))
+    if key not in _processes or _processes[key].process.poll() is not None:
+        _processes[key] = CatFile(repo_path)
+    return _processes[key]
+
+def close_all():
+    for key in [key for key in _processes if key[0] == os.getpid()]:
+        _processes.pop(key).close()
+
+atexit.register(close_all)
+
+def read_objects(repo_path, shas):
+    """
+    Return {sha: content} for the given objects, read with the repo's cat-file process
+    """
+    return {sha: content for sha, (_, _, content) in get_cat_file(repo_path).read(list(shas)).items()}
+
+def format_date(timestamp, offset):
+    """
+    Format a raw git date ("1700000000", "+0100") like git's %ci
+    """
+    minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+    if offset[0] == '-':
+        minutes = -minutes
+    date = datetime.fromtimestamp(int(timestamp), timezone(timedelta(minutes=minutes)))
+    return date.strftime('%Y-%m-%d %H:%M:%S ') + offset
+
+def parse_identity(value):
+    """
+    Split "Name <email> timestamp offset" into (name, email, %ci date)
+    """
+    name, _, rest = value.partition(' <')
+    email, _, date = rest.partition('> ')
+    timestamp, _, offset = date.partition(' ')
+    return name, email, format_date(timestamp, offset)
+
+def parse_commit(sha, content):
+    """
+    Read the parents, author and committer date from the header of a raw commit object
+    """
+    commit = {"sha": sha, "parents": []}
+    for line in content.split(b'\n'):
+        # The header ends at the first empty line
+        if not line:
+            break
+        field, _, value = line.decode('utf-8', errors='replace').partition(' ')
+        if field == 'parent':
+            commit["parents"].append(value)
+        elif field == 'author':
+            commit["author"], commit["author_email"], commit["author_date"] = parse_identity(value)
+        elif field == 'committer':
+            _, _, commit["committer_date"] = parse_identity(value)
+    return commit
+
+def get_commits(repo_path, revisions):
+    """
+    Return {revision: commit header} for the given revisions (shas or any revision git understands),
+    reading in one batch the ones that are not full shas looked up before
+    """
+    repo = os.path.abspath(repo_path)
+    commits = {}
+    missing = []
+    for revision in dict.fromkeys(revisions):
+        if FULL_SHA.fullmatch(revision) and (repo, revision) in _commits:
+            commits[revision] = _commits[(repo, revision)]
+        else:
+            missing.append(revision)
+
+    if missing:
+        objects = get_cat_file(repo_path).read([f"{revision}^{{commit}}" for revision in missing])
+        for revision in missing:
+            found = objects.get(f"{revision}^{{commit}}")
+            commits[revision] = parse_commit(found[0], found[2]) if found else None
+            if FULL_SHA.fullmatch(revision):
+                _commits[(repo, revision)] = commits[revision]
+            elif found:
+                _commits[(repo, found[0])] = commits[revision]
+
+    return {revision: commits[revision] for revision in revisions if commits[revision]}
+
+def get_commit(repo_path, revision):
+    return get_commits(repo_path, [revision]).get(revision)
+
+def get_first_parent(repo_path, revision):
+    """
+    Same as git rev-parse <revision>^1, None for a root commit or an unknown revision
+    """
+    commit = get_commit(repo_path, revision)
+    if commit is None or not commit["parents"]:
+        return None
+    return commit["parents"][0]
+
+def get_author(repo_path, revision):
+    """
+    Same as git log -1 --pretty=%an <revision>
+    """
+    commit = get_commit(repo_path, revision)
+    return commit["author"] if commit else None
+
+def get_commit_dates(repo_path, revisions):
+    """
+    Return {revision: committer date formatted like %ci}
+    """
+    return {revision: commit["committer_date"] for revision, commit in get_commits(repo_path, revisions).items()}
@@ -0,0 +1,144 @@
+import os
+import json
+import sqlite3
+import subprocess
+
+CACHE_PATH = os.path.join("cache", "loc_cache.sqlite")
+
+# One connection per process and cache file, forked workers must not reuse the parent's connection
+_connections = {}
+
+def get_connection(cache_path=CACHE_PATH):
+    """
+    Open (and create if needed) the LOC cache database
+    """
+    key = (os.getpid(), cache_path)
+    if key in _connections:
+        return _connections[key]
+
+    if os.path.dirname(cache_path):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    connection = sqlite3.connect(cache_path, timeout=60)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS commit_loc (
+            repo TEXT NOT NULL,
+            sha TEXT NOT NULL,
+            language TEXT NOT NULL,
+            lines INTEGER NOT NULL,
+            PRIMARY KEY (repo, sha, language)
+        )"""
+    )
+    # Trees without any recognized file still have to be marked as counted
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS counted_commits (
+            repo TEXT NOT NULL,
+            sha TEXT NOT NULL,
+            PRIMARY KEY (repo, sha)
+        )"""
+    )
+    # Blobs are content-addressed, so their line counts are shared by all repositories
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS blob_lines (
+            sha TEXT PRIMARY KEY,
+            lines INTEGER NOT NULL
+        )"""
+    )
+    connection.commit()
+
+    _connections[key] = connection
+    return connection
+
+def repo_key(repo_path):
+    """
+    Name under which a repository is stored in the cache, e.g. repos/ant.git -> ant.git
+    """
+    return os.path.basename(os.path.normpath(repo_path))
+
+def sparse_key(repo):
+    """
+    Key of the counts made in sparse worktrees. They miss the languages that scc has no extension for,
+    so they must never be read as the counts of the whole tree
+    """
+    return f"{repo}#sparse"
+
+def load_languages(repo, commit_hash, cache_path=CACHE_PATH):
+    """
+    Return the cached {language: lines} of a commit, or None if it was never counted
+    """
+    connection = get_connection(cache_path)
+
+    counted = connection.execute(
+        "SELECT 1 FROM counted_commits WHERE repo = ? AND sha = ?", (repo, commit_hash)
+    ).fetchone()
+    if not counted:
+        return None
+
+    rows = connection.execute(
+        "SELECT language, lines FROM commit_loc WHERE repo = ? AND sha = ?", (repo, commit_hash)
+    ).fetchall()
+    return dict(rows)
+
+def save_languages(repo, commit_hash, languages, cache_path=CACHE_PATH):
+    connection = get_connection(cache_path)
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO commit_loc (repo, sha, language, lines) VALUES (?, ?, ?, ?)",
+            [(repo, commit_hash, language, lines) for language, lines in languages.items()]
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO counted_commits (repo, sha) VALUES (?, ?)", (repo, commit_hash)
+        )
+
+def load_blob_lines(blob_shas, cache_path=CACHE_PATH):
+    """
+    Return the cached {blob sha: lines} for the blobs that were already counted
+    """
+    connection = get_connection(cache_path)
+    blob_shas = list(blob_shas)
+
+    blob_lines = {}
+    # Stay below SQLite's limit of bound parameters per statement
+    for i in range(0, len(blob_shas), 500):
+        batch = blob_shas[i:i + 500]
+        rows = connection.execute(
+            f"SELECT sha, lines FROM blob_lines WHERE sha IN ({','.join('?' * len(batch))})", batch
+        ).fetchall()
+        blob_lines.update(rows)
+    return blob_lines
+
+def save_blob_lines(blob_lines, cache_path=CACHE_PATH):
+    connection = get_connection(cache_path)
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO blob_lines (sha, lines) VALUES (?, ?)", blob_lines.items()
+        )
+
+def run_scc_languages(repo_path):
+    """
+    Execute scc on a folder and return the lines of every language it recognized, or None on failure
+    """
+    try:
+        result = subprocess.run(
+            ['scc', '--no-cocomo', '--no-complexity', '--format', 'json', repo_path],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+
+        languages_data = json.loads(result.stdout)
+
+        return {lang_data.get('Name'): lang_data.get('Lines', 0) for lang_data in languages_data}
+    except subprocess.CalledProcessError as e:
+        print(f"[SCC error]: {e}")
+        return None
+    except json.JSONDecodeError as e:
+        print(f"[Json decoding scc error]: {e}")
+        return None
+
+def filter_loc(languages, programming_languages):
+    """
+    Total lines of the languages we consider as source code
+    """
+    return sum(lines for language, lines in languages.items() if language in programming_languages)
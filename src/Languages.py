@@ -0,0 +1,46 @@
+import os
+
+# Extension -> language, using the same language names and extensions as scc (languages.json)
+# Headers are separate languages in scc ('C Header', 'C++ Header'), so they are kept separate here too
+SCC_EXTENSIONS = {
+    'java': 'Java',
+    'py': 'Python', 'pyw': 'Python', 'pyi': 'Python',
+    'cc': 'C++', 'cpp': 'C++', 'cxx': 'C++', 'c++': 'C++', 'pcc': 'C++', 'ino': 'C++',
+    'ccm': 'C++', 'cppm': 'C++', 'cxxm': 'C++', 'c++m': 'C++', 'mxx': 'C++',
+    'hh': 'C++ Header', 'hpp': 'C++ Header', 'hxx': 'C++ Header', 'inl': 'C++ Header', 'ipp': 'C++ Header',
+    'cs': 'C#', 'csx': 'C#',
+    'js': 'JavaScript', 'cjs': 'JavaScript', 'mjs': 'JavaScript',
+    'jsx': 'JSX',
+    'php': 'PHP',
+    'c': 'C', 'ec': 'C', 'pgc': 'C',
+    'h': 'C Header',
+    'r': 'R',
+    'swift': 'Swift',
+    'go': 'Go',
+    'rs': 'Rust',
+    'rb': 'Ruby',
+    'kt': 'Kotlin', 'kts': 'Kotlin',
+    'ts': 'TypeScript', 'tsx': 'TypeScript',
+    'd.ts': 'TypeScript Typings',
+}
+
+def language_of(path):
+    """
+    Return the scc language of a file path, or None if scc would not recognize it
+    """
+    name = os.path.basename(path).lower()
+
+    # scc matches the longest extension first, e.g. d.ts before ts
+    parts = name.split('.')
+    for i in range(1, len(parts)):
+        language = SCC_EXTENSIONS.get('.'.join(parts[i:]))
+        if language:
+            return language
+
+    return None
+
+def extensions_of(programming_languages):
+    """
+    All the extensions belonging to a set of languages
+    """
+    return sorted(ext for ext, language in SCC_EXTENSIONS.items() if language in programming_languages)
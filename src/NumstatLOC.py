@@ -0,0 +1,163 @@
+import os
+import json
+import random
+import argparse
+import subprocess
+import numpy as np
+
+from src import GitService, CommitTable, WorktreePool
+from src.DiffMining import unquote_path
+from src.Languages import language_of
+
+def read_numstat(repo_path, commit_hashes):
+    """
+    Per-file line counts of the given commits against their first parent, from a single git log --numstat.
+    Return the arrays (commit index, lines added, lines deleted, paths), binary files count as 0
+    """
+    index = {sha: i for i, sha in enumerate(commit_hashes)}
+    process = subprocess.Popen(
+        ['git', 'log', '--no-walk=unsorted', '--stdin', '--numstat', '--no-renames', '--diff-merges=first-parent',
+         '--format=%x1e%H'],
+        cwd=repo_path,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        encoding='utf-8',
+        errors='replace'
+    )
+    # git only starts writing once it has read all the commits, so stdin can be written at once
+    process.stdin.write("".join(f"{sha}\n" for sha in commit_hashes))
+    process.stdin.close()
+
+    commit_index = []
+    added = []
+    deleted = []
+    paths = []
+    current = None
+    for line in process.stdout:
+        if line.startswith('\x1e'):
+            current = index.get(line[1:].strip())
+            continue
+        fields = line.rstrip('\n').split('\t', 2)
+        if current is None or len(fields) != 3:
+            continue
+        commit_index.append(current)
+        added.append(int(fields[0]) if fields[0] != '-' else 0)
+        deleted.append(int(fields[1]) if fields[1] != '-' else 0)
+        paths.append(unquote_path(fields[2]))
+    process.wait()
+
+    return (np.array(commit_index, dtype=np.int64), np.array(added, dtype=np.int64),
+            np.array(deleted, dtype=np.int64), paths)
+
+def numstat_tlocs(repo_path, commit_hashes, programming_languages, project=None):
+    """
+    TLOC (abs(loc(commit) - loc(first parent)) over the given languages) of many commits at once,
+    from the lines added and deleted by each commit instead of counting whole trees.
+    Return {revision: (tloc, previous sha)} keyed by the given revisions, root and unknown commits are left out
+    """
+    # Parents come from the commit table, git is only asked for what it does not know (e.g. abbreviated shas)
+    commit_hashes = list(dict.fromkeys(commit_hashes))
+    commits = CommitTable.get_commits(repo_path, commit_hashes, project)
+    missing = [sha for sha in commit_hashes if sha not in commits]
+    if missing:
+        commits.update(GitService.get_commits(repo_path, missing))
+    # Revisions are keyed as they were given, git log prints the full sha of the commit they resolved to
+    revisions = [revision for revision, commit in commits.items() if commit["parents"]]
+    shas = list(dict.fromkeys(commits[revision]["sha"] for revision in revisions))
+    if not shas:
+        return {}
+
+    commit_index, added, deleted, paths = read_numstat(repo_path, shas)
+
+    # Languages are looked up once per path, everything else is vectorised
+    counted = {}
+    mask = np.array([counted.setdefault(path, language_of(path) in programming_languages) for path in paths],
+                    dtype=bool)
+    delta = np.bincount(commit_index[mask], weights=(added - deleted)[mask], minlength=len(shas))
+    tlocs = np.abs(np.rint(delta)).astype(np.int64)
+
+    position = {sha: i for i, sha in enumerate(shas)}
+    return {
+        revision: (int(tlocs[position[commits[revision]["sha"]]]), commits[revision]["parents"][0])
+        for revision in revisions
+    }
+
+def sample_commits(repo_path, result_dir_path, sample_size, seed=0):
+    """
+    Random refactoring commits of a project (any commit if it has no refactoring results) that have a parent
+    """
+    refactoring_results = os.path.join(result_dir_path, "ListOfRefactoringCommits.json")
+    if os.path.exists(refactoring_results):
+        with open(refactoring_results, 'r') as f:
+            candidates = [commit['sha1'] for commit in json.load(f).get('commits', []) if commit.get('sha1')]
+    else:
+        result = subprocess.run(['git', 'rev-list', '--all', '--no-merges'], cwd=repo_path,
+                                capture_output=True, text=True)
+        candidates = result.stdout.split()
+
+    commits = CommitTable.get_commits(repo_path, candidates)
+    candidates = [sha for sha in dict.fromkeys(candidates) if sha in commits and commits[sha]["parents"]]
+    return random.Random(seed).sample(candidates, min(sample_size, len(candidates)))
+
+def validate(project, sample_size=50, num_workers=2, seed=0, repos_dir="repos", results_dir="results"):
+    """
+    Compare the numstat TLOC with the scc TLOC on a sample of commits and report how far they diverge
+    """
+    # TLOCMining uses this module for its numstat mode
+    from src import TLOCMining
+
+    repo_path = os.path.join(repos_dir, project)
+    sample = sample_commits(repo_path, os.path.join(results_dir, project), sample_size, seed)
+    if not sample:
+        print(f"[No commits to validate] : {project}")
+        return None
+
+    numstat = numstat_tlocs(repo_path, sample, TLOCMining.PROGRAMMING_LANGUAGES, project)
+
+    # scc counts are checked out in worktrees so the clone is left untouched
+    scc = WorktreePool.run_on_worktrees(
+        repo_path,
+        [(sha, project, "scc", False) for sha in sample],
+        TLOCMining.commit_effort_task,
+        max(2, num_workers)
+    )
+
+    rows = []
+    for sha, (scc_tloc, _, _) in zip(sample, scc):
+        numstat_tloc = numstat.get(sha, (0, None))[0]
+        rows.append((sha, scc_tloc, numstat_tloc, abs(numstat_tloc - scc_tloc)))
+
+    errors = np.array([row[3] for row in rows], dtype=np.int64)
+    scc_total = max(1, sum(row[1] for row in rows))
+    report = {
+        "project": project,
+        "commits": len(rows),
+        "exact": int(np.count_nonzero(errors == 0)),
+        "mean_abs_error": float(errors.mean()),
+        "max_abs_error": int(errors.max()),
+        "relative_error": float(errors.sum() / scc_total),
+    }
+
+    print(f"[TLOC validation] : {project} : {report['exact']}/{report['commits']} commits identical, "
+          f"mean abs error {report['mean_abs_error']:.1f} lines, max {report['max_abs_error']}, "
+          f"{100 * report['relative_error']:.2f}% of the scc TLOC")
+    for sha, scc_tloc, numstat_tloc, error in sorted(rows, key=lambda row: -row[3])[:10]:
+        if error:
+            print(f"  {sha} : scc {scc_tloc}, numstat {numstat_tloc}")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="numstat TLOC backend")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    validate_parser = subparsers.add_parser("validate", help="compare the numstat TLOC with scc on a sample of commits")
+    validate_parser.add_argument("project", help="project name in the repos directory, e.g. ant.git")
+    validate_parser.add_argument("--sample", type=int, default=50, help="number of commits to compare")
+    validate_parser.add_argument("--workers", type=int, default=2, help="worktrees running scc")
+    validate_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "validate":
+        validate(args.project, args.sample, args.workers, args.seed)
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import logging
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from src import Resources, GitService, downloadRepos, prepareRepos, CommitTable, RefactoringMining, DiffMining, CommitEvents, BugFixing
+
+STATE_FILE = os.path.join("cache", "pipeline_state.json")
+
+# Stages run for every project, with the stages they wait for and the cores and memory they need.
+# TLOC and effort come from the same traversal of the refactoring commits, which reads blobs and never checks out
+# commits. Their TLOC is the line count of the changed blobs (TLOCMining's "blobs" mode), not the scc count
+# of TLOCMining's default "scc" mode
+STAGES = {
+    "clone": {"depends": [], "cpus": 1, "memory_mb": 512},
+    "prepare": {"depends": ["clone"], "cpus": 2, "memory_mb": 2048},
+    "refactoring": {"depends": ["prepare"], "cpus": 2,
+                    "memory_mb": int(2 * RefactoringMining.DEFAULT_HEAP_MB * RefactoringMining.JVM_OVERHEAD)},
+    "diff": {"depends": ["prepare"], "cpus": 2, "memory_mb": 2048},
+    "tloc": {"depends": ["refactoring"], "cpus": 2, "memory_mb": 1024},
+    "issues": {"depends": [], "cpus": 1, "memory_mb": 256},
+}
+
+def check_output(path, started=None):
+    """
+    Raise if a stage did not write its result file, or only left the one of a previous run
+    """
+    if not os.path.exists(path):
+        raise Exception(f"{path} was not written")
+    if started is not None and os.path.getmtime(path) < started:
+        raise Exception(f"{path} was not updated")
+
+def run_stage(project, stage, repos_dir="repos", results_dir="results"):
+    """
+    Run one stage of one project, raise if it failed
+    """
+    cpus = STAGES[stage]["cpus"]
+    started = time.time()
+
+    if stage == "clone":
+        if not os.path.isdir(os.path.join(repos_dir, project)):
+            downloadRepos.clone_repo(project, repos_dir, results_dir)
+        if not os.path.isdir(os.path.join(repos_dir, project)):
+            raise Exception(f"{project} could not be cloned")
+    elif stage == "prepare":
+        if prepareRepos.prepare_repos([project], repos_dir):
+            raise Exception(f"{project} could not be prepared")
+        # Build or refresh the commit table before the stages that read it
+        CommitTable.get_table(os.path.join(repos_dir, project), project)
+    elif stage == "refactoring":
+        RefactoringMining.run_project(project, num_workers=cpus, heap_mb=RefactoringMining.DEFAULT_HEAP_MB,
+                                      repos_dir=repos_dir, results_dir=results_dir)
+        if not os.path.exists(os.path.join(results_dir, project, "ListOfRefactoringCommits.json")):
+            raise Exception(f"no refactorings were mined for {project}")
+    elif stage == "diff":
+        DiffMining.run_project(project, num_workers=cpus, repos_dir=repos_dir, results_dir=results_dir)
+        if not os.path.exists(os.path.join(results_dir, project, "CommitsDiff.json")):
+            raise Exception(f"no diffs were mined for {project}")
+    elif stage == "tloc":
+        # CommitsDiff is left to the diff stage, which keeps the diff bodies
+        CommitEvents.run_project(project, diff=False, repos_dir=repos_dir, results_dir=results_dir)
+        check_output(os.path.join(results_dir, project, "TLOC_mining.csv"), started)
+        check_output(os.path.join(results_dir, project, "DeveloperEffort_mining.json"), started)
+    elif stage == "issues":
+        os.makedirs(os.path.join(results_dir, project), exist_ok=True)
+        BugFixing.run_project(project, results_dir=results_dir)
+        # An incremental refresh with nothing new leaves the issues file as it was.
+        # Projects without GitHub issues get an empty file
+        repo = project.split("_", 1)[1]
+        check_output(os.path.join(results_dir, project, f"{repo}_issues.json"))
+
+def run_task(project, stage, repos_dir="repos", results_dir="results"):
+    """
+    Run a stage in a pool process. The pool processes are reused, so the git processes
+    the stage started are stopped with it
+    """
+    try:
+        run_stage(project, stage, repos_dir, results_dir)
+    finally:
+        GitService.close_all()
+
+def load_state(state_file=STATE_FILE):
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, "r") as f:
+        return json.load(f)
+
+def save_state(state, state_file=STATE_FILE):
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    with open(state_file + ".tmp", "w") as f:
+        json.dump(state, f, indent=4)
+    os.replace(state_file + ".tmp", state_file)
+
+def task_key(project, stage):
+    return f"{project}:{stage}"
+
+def repo_size(repo_path):
+    """
+    Size in KiB of the objects of a cloned repo, 0 if it is not cloned yet
+    """
+    if not os.path.isdir(repo_path):
+        return 0
+    process = subprocess.run(['git', 'count-objects', '-v'], cwd=repo_path, capture_output=True, text=True)
+    if process.returncode != 0:
+        return 0
+    counts = dict(line.split(": ") for line in process.stdout.splitlines() if ": " in line)
+    return int(counts.get("size", 0)) + int(counts.get("size-pack", 0))
+
+def list_projects(repos_dir="repos", names_file="repos_names.json"):
+    """
+    Projects listed in repos_names.json (cloned or not), or the cloned ones if there is no such file
+    """
+    if os.path.exists(names_file):
+        with open(names_file, "r") as f:
+            return list(json.load(f))
+    if not os.path.exists(repos_dir):
+        return []
+    return [project for project in os.listdir(repos_dir) if os.path.isdir(os.path.join(repos_dir, project))]
+
+def rank_tasks(tasks, sizes):
+    """
+    Put the tasks of the largest repos first, so the longest tasks do not end up running alone at the end.
+    The sort is stable, so the stages of a project keep their order
+    """
+    tasks.sort(key=lambda task: sizes.get(task[0], 0), reverse=True)
+
+def plan_tasks(projects, sizes, stages=STAGES):
+    """
+    (project, stage) tasks with the largest repos first
+    """
+
+    tasks = []
+    for project in projects:
+        for stage in stages:
+            # Only projects named owner_repo can be looked up on GitHub
+            if stage == "issues" and "_" not in project:
+                continue
+            tasks.append((project, stage))
+    rank_tasks(tasks, sizes)
+    return tasks
+
+def run(max_cpus=None, reserve_mb=2048, repos_dir="repos", results_dir="results", state_file=STATE_FILE):
+    """
+    Run every stage of every project, as many at once as the cores and the memory allow.
+    A task starts once the tasks it depends on are done, finished tasks are recorded and skipped on the next run
+    """
+    logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+    cpu_budget = max_cpus or Resources.cpu_count()
+    memory_budget = Resources.available_memory_mb() - reserve_mb
+
+    state = load_state(state_file)
+    projects = list_projects(repos_dir)
+    # Repos that are not cloned yet count as empty until their clone task is done
+    sizes = {project: repo_size(os.path.join(repos_dir, project)) for project in projects}
+    pending = [task for task in plan_tasks(projects, sizes) if task_key(*task) not in state]
+    failed = set()
+
+    print(f"[Pipeline] : {len(pending)} tasks to run with {cpu_budget} cores and {memory_budget} MB")
+
+    running = {}
+    used_cpus = 0
+    used_memory = 0
+    with ProcessPoolExecutor(max_workers=cpu_budget) as executor:
+        while pending or running:
+            for task in list(pending):
+                project, stage = task
+                depends = [task_key(project, depend) for depend in STAGES[stage]["depends"]]
+
+                # Tasks waiting for a failed task are never run
+                if any(depend in failed for depend in depends):
+                    print(f"[Pipeline] : skipping {task_key(*task)}, a task it depends on failed")
+                    failed.add(task_key(*task))
+                    pending.remove(task)
+                    continue
+
+                if not all(depend in state for depend in depends):
+                    continue
+
+                # A task bigger than the budgets still runs, alone
+                cpus, memory_mb = STAGES[stage]["cpus"], STAGES[stage]["memory_mb"]
+                if running and (used_cpus + cpus > cpu_budget or used_memory + memory_mb > memory_budget):
+                    continue
+
+                future = executor.submit(run_task, project, stage, repos_dir, results_dir)
+                running[future] = (task, time.time())
+                used_cpus += cpus
+                used_memory += memory_mb
+                pending.remove(task)
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                (project, stage), started = running.pop(future)
+                used_cpus -= STAGES[stage]["cpus"]
+                used_memory -= STAGES[stage]["memory_mb"]
+
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"[Pipeline] : {task_key(project, stage)} failed: {e}")
+                    failed.add(task_key(project, stage))
+                    continue
+
+                elapsed = time.time() - started
+                state[task_key(project, stage)] = {"finished_at": time.time(), "seconds": round(elapsed, 1)}
+                save_state(state, state_file)
+                print(f"[Pipeline] : {task_key(project, stage)} done in {time.strftime('%H:%M:%S', time.gmtime(elapsed))}")
+
+                # The size of a repo is only known once it is cloned
+                if stage == "clone":
+                    sizes[project] = repo_size(os.path.join(repos_dir, project))
+                    rank_tasks(pending, sizes)
+
+    print(f"[Pipeline] : {len(state)} tasks done, {len(failed)} failed or skipped")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import time
+
+LEDGER_FILE = "RMining_progress.sqlite"
+
+def open_ledger(result_dir_path):
+    """
+    Open (and create if needed) the ledger recording the finished RefactoringMiner chunks of a project
+    """
+    os.makedirs(result_dir_path, exist_ok=True)
+
+    connection = sqlite3.connect(os.path.join(result_dir_path, LEDGER_FILE), timeout=60)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS chunks (
+            chunk_file TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            finished_at REAL NOT NULL,
+            merged INTEGER NOT NULL DEFAULT 0
+        )"""
+    )
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS commits (
+            sha TEXT PRIMARY KEY,
+            chunk_file TEXT NOT NULL
+        )"""
+    )
+    connection.commit()
+    return connection
+
+def is_empty(connection):
+    return connection.execute("SELECT 1 FROM chunks LIMIT 1").fetchone() is None
+
+def record_chunk(connection, chunk_file, position, commits):
+    """
+    Record a chunk whose output file was completely written, with the commits it covers.
+    position is the index of its first commit in the history, used to merge chunks in order
+    """
+    with connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO chunks (chunk_file, position, finished_at) VALUES (?, ?, ?)",
+            (chunk_file, position, time.time())
+        )
+        connection.executemany(
+            "INSERT OR REPLACE INTO commits (sha, chunk_file) VALUES (?, ?)",
+            [(sha, chunk_file) for sha in commits]
+        )
+
+def analyzed_commits(connection):
+    return {sha for (sha,) in connection.execute("SELECT sha FROM commits")}
+
+def unmerged_chunks(connection):
+    """
+    Chunk files that were not merged yet, in history order
+    """
+    rows = connection.execute("SELECT chunk_file FROM chunks WHERE merged = 0 ORDER BY position")
+    return [chunk_file for (chunk_file,) in rows]
+
+def mark_merged(connection, chunk_files):
+    with connection:
+        connection.executemany(
+            "UPDATE chunks SET merged = 1 WHERE chunk_file = ?", [(chunk_file,) for chunk_file in chunk_files]
+        )
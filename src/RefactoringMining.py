@@ -1,79 +1,225 @@
 import os
+import sys
+import argparse
 import subprocess
 import json
 import time
 from collections import defaultdict
 from datetime import datetime
 import numpy as np
-from concurrent.futures import ProcessPoolExecutor
+import platform
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from src import Resources, ProgressLedger, CommitTable
+from src.Languages import language_of
+
+# RefactoringMiner's heap bounds in MB, a JVM uses roughly JVM_OVERHEAD times its heap in total
+MIN_HEAP_MB = 1024
+DEFAULT_HEAP_MB = 2048
+MAX_HEAP_MB = 8192
+JVM_OVERHEAD = 1.25
 
 def find_analyzed_commits(result_dir_path):
     """
-    Find commits that were already analyzed
+    Find commits that were already analyzed by reading the chunk files.
+    Only used for chunks written before the progress ledger existed
     """
-    commit_set = set()
+    chunk_commits = {}
     invalid_json_files = []
 
     # Return empty values if the result directory does not exist yet
     if not os.path.exists(result_dir_path):
-        return commit_set, invalid_json_files
+        return chunk_commits, invalid_json_files
 
     for file in os.listdir(result_dir_path):
 
+        if not (file.startswith("chunk_") and file.endswith(".json")):
+            continue
+
         file_path = os.path.join(result_dir_path, file)
         
         with open(file_path, "r") as f:
 
             try:
                 data = json.load(f)
-                for commit in data["commits"]:
-                    commit_set.add(commit["sha1"])
+                chunk_commits[file] = [commit["sha1"] for commit in data["commits"]]
             except:
                 invalid_json_files.append(file_path)
 
-    return commit_set, invalid_json_files
+    return chunk_commits, invalid_json_files
+
+# Estimated cost of a commit for RefactoringMiner, in changed Java lines: a fixed part for checking out and
+# building the model of the commit, plus a part for every Java file and every Java line it changes
+COMMIT_BASE_COST = 200
+JAVA_FILE_COST = 50
+
+def estimate_commit_costs(repo_path):
+    """
+    Estimate what every commit reachable from HEAD costs to RefactoringMiner from a single git log --numstat.
+    Merges are skipped by RefactoringMiner and only get the fixed cost
+    """
+    process = subprocess.Popen(
+        ["git", "-C", repo_path, "log", "--numstat", "--no-renames", "--format=%x1e%H", "HEAD"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        encoding="utf-8",
+        errors="replace"
+    )
+
+    costs = {}
+    sha = None
+    for line in process.stdout:
+        if line.startswith("\x1e"):
+            sha = line[1:].strip()
+            costs[sha] = COMMIT_BASE_COST
+            continue
+        fields = line.rstrip("\n").split("\t", 2)
+        if sha is None or len(fields) != 3 or language_of(fields[2].strip('"')) != "Java":
+            continue
+        # Binary files are reported as '-'
+        lines = sum(int(field) for field in fields[:2] if field != "-")
+        costs[sha] += JAVA_FILE_COST + lines
+    process.wait()
+
+    return costs
 
-def chunk_commits(repo_path, result_dir_path, chunk_size=100):
-    """Split commits into chunks for parallel processing"""
+def find_outliers(commit_costs, num_chunks):
+    """
+    Indexes of the commits that cost more than an even share of what the other commits cost,
+    from the most expensive down. Each of them needs a chunk of its own
+    """
+    outliers = []
+    remaining = int(commit_costs.sum())
+    for i in np.argsort(-commit_costs, kind="stable"):
+        if len(outliers) == num_chunks - 1 or commit_costs[i] <= remaining / (num_chunks - len(outliers)):
+            break
+        outliers.append(int(i))
+        remaining -= int(commit_costs[i])
+    return sorted(outliers)
+
+def split_segment(commit_costs, num_chunks):
+    """
+    Cut a run of commits into exactly num_chunks contiguous chunks of roughly equal cost.
+    Return the cut positions
+    """
+    cumulative = np.cumsum(commit_costs)
+    targets = cumulative[-1] * np.arange(1, num_chunks) / num_chunks
+    # Every target is cut after the commits that are more than half below it
+    cuts = [int(cut) for cut in np.searchsorted(cumulative - commit_costs / 2, targets)]
+
+    # Equal cuts would merge chunks, so every cut is moved to leave at least one commit in each chunk
+    for i in range(len(cuts)):
+        cuts[i] = max(cuts[i], cuts[i - 1] + 1 if i else 1)
+    for i in reversed(range(len(cuts))):
+        cuts[i] = min(cuts[i], cuts[i + 1] - 1 if i + 1 < len(cuts) else len(commit_costs) - 1)
+    return cuts
+
+def balance_chunks(commits, costs, num_chunks):
+    """
+    Cut the commits into contiguous chunks of roughly equal estimated cost, at least min(num_chunks, commits) of them.
+    A commit costing more than a chunk ends up alone in its chunk and the other chunks share the rest.
+    Returns (start, end, estimated cost) for every chunk
+    """
+    commit_costs = np.array([costs.get(sha, COMMIT_BASE_COST) for sha in commits], dtype=np.int64)
+    num_chunks = min(num_chunks, len(commits))
+    if num_chunks == 0:
+        return []
+
+    outliers = find_outliers(commit_costs, num_chunks)
+
+    # The outliers split the history into runs of commits, that share the chunks left by their cost.
+    # Every run gets at least one chunk and at most one per commit
+    bounds = [-1] + outliers + [len(commits)]
+    segments = [(start + 1, end) for start, end in zip(bounds, bounds[1:]) if end > start + 1]
+    shares = [1] * len(segments)
+    for _ in range(num_chunks - len(outliers) - len(segments)):
+        candidates = [i for i, (start, end) in enumerate(segments) if shares[i] < end - start]
+        if not candidates:
+            break
+        i = max(candidates, key=lambda i: commit_costs[segments[i][0]:segments[i][1]].sum() / shares[i])
+        shares[i] += 1
+
+    cuts = set(outliers) | {outlier + 1 for outlier in outliers}
+    for (start, end), share in zip(segments, shares):
+        cuts.update(start + cut for cut in split_segment(commit_costs[start:end], share))
+    bounds = [0] + sorted(cut for cut in cuts if 0 < cut < len(commits)) + [len(commits)]
+
+    return [(start, end, int(commit_costs[start:end].sum())) for start, end in zip(bounds, bounds[1:])]
+
+def chunk_commits(repo_path, result_dir_path, ledger, chunk_size=100):
+    """
+    Split the commits that are not in the progress ledger into chunks for parallel processing.
+    There are about as many chunks as with chunk_size commits each, but their boundaries are chosen
+    so that they have roughly the same estimated cost.
+    Returns (position of the first commit in the history, commits, estimated cost) for every chunk
+    """
     get_commits_command = ["git", "-C", repo_path, "rev-list", "--reverse", "HEAD"]
     result = subprocess.run(get_commits_command, capture_output=True, text=True)
     
     if result.returncode != 0:
         raise Exception(f"Failed to get commits: {result.stderr}")
 
-    # Find commits that were already analyzed. This will be empty if this is a new repository
-    # If there are chunks, this will allow the program to get back to its previous state
-    commit_set, invalid_json_files = find_analyzed_commits(result_dir_path)
-
     # Find all commit hashes from the output of the command above
     all_commits = result.stdout.strip().split('\n')
+    positions = {sha: i for i, sha in enumerate(all_commits)}
 
-    # Filter out the commits that were already analyzed
-    # as in, create a new list with only the commits not found in commit_set
-    # This operation should preserve the order of the commits,
-    # but might not do so if the program has previously failed to preserve the order
-    commits = [x for x in all_commits if x not in commit_set]
+    if os.path.exists(result_dir_path):
+        # Chunks are written to a temporary file and renamed once complete,
+        # so a leftover temporary file is a chunk that was interrupted
+        for file in os.listdir(result_dir_path):
+            if file.startswith("chunk_") and file.endswith(".tmp"):
+                os.remove(os.path.join(result_dir_path, file))
+
+    # Chunks written before the ledger existed are read once and recorded in it
+    if ProgressLedger.is_empty(ledger):
+        legacy_chunks, invalid_json_files = find_analyzed_commits(result_dir_path)
 
-    # Delete invalid JSON files that appear if the program was terminated while processing a chunk
-    for file in invalid_json_files:
-        print(f"Removing malformed JSON file {file} to reprocess it...")
-        os.remove(file)
+        for file, commits in legacy_chunks.items():
+            position = min((positions.get(sha, len(all_commits)) for sha in commits), default=len(all_commits))
+            ProgressLedger.record_chunk(ledger, file, position, commits)
+
+        # Keep malformed files aside instead of deleting them, their commits will be processed again
+        for file in invalid_json_files:
+            print(f"Moving malformed JSON file {file} aside to reprocess it...")
+            os.replace(file, file + ".invalid")
+
+    # Find commits that were already analyzed. This will be empty if this is a new repository
+    # If there are chunks, this will allow the program to get back to its previous state
+    commit_set = ProgressLedger.analyzed_commits(ledger)
+
+    # Filter out the commits that were already analyzed, preserving the order of the commits
+    commits = [x for x in all_commits if x not in commit_set]
 
     print(f"Found {len(commits)} remaining commits")
+    if not commits:
+        return []
 
     # Return a list containing the commit chunks
-    return [commits[i:i + chunk_size] for i in range(0, len(commits), chunk_size)]
+    num_chunks = -(-len(commits) // chunk_size)
+    chunks = balance_chunks(commits, estimate_commit_costs(repo_path), num_chunks)
+    return [(positions[commits[start]], commits[start:end], cost) for start, end, cost in chunks]
  
+def get_refactoring_miner_dir():
+    return os.path.join(os.getcwd(), "RefactoringMiner-3.0.9")
+
+def get_refactoring_miner_launcher():
+    """The .bat launcher only works on Windows, the distribution also ships a shell launcher for Linux"""
+    launcher = "RefactoringMiner.bat" if platform.system() == "Windows" else "RefactoringMiner"
+    return os.path.join(get_refactoring_miner_dir(), "bin", launcher)
+
 def run_refactoring_miner_chunk(args):
-    counter, total_chunks, repo_path, result_dir_path, start_commit, end_commit = args
-    REFACTORING_MINER_PATH = os.path.join(os.getcwd(), "RefactoringMiner-3.0.9", "bin", "RefactoringMiner.bat")
+    counter, total_chunks, repo_path, result_dir_path, start_commit, end_commit, heap_mb, commits = args
+    REFACTORING_MINER_PATH = get_refactoring_miner_launcher()
     
     chunk_output = os.path.join(os.getcwd(), result_dir_path, f"chunk_{start_commit[:8]}_{end_commit[:8]}.json")
+    tmp_output = chunk_output + ".tmp"
     repo_path = os.path.join(os.getcwd(), repo_path)
 
+    # Complete chunk files only exist once renamed, the ledger may just not have recorded it yet
     if os.path.exists(chunk_output):
         print(f"Skipping chunk {start_commit[:8]}-{end_commit[:8]} as it was already processed")
-        return None
+        return chunk_output
 
     command = [
         REFACTORING_MINER_PATH,
@@ -82,21 +228,22 @@ def run_refactoring_miner_chunk(args):
         start_commit,
         end_commit,
         "-json",
-        chunk_output
+        tmp_output
     ]
 
     if not os.path.exists(os.path.dirname(chunk_output)):
         print(f"{os.path.dirname(chunk_output)} does not exist. Creating it...")
         os.makedirs(os.path.dirname(chunk_output))
 
-    # Set the Xmx flag to something much less if your computer is not that powerful
+    # The heap budget is chosen by the scheduler from the free memory, see plan_refactoring_miner
     env = os.environ.copy()
-    env["_JAVA_OPTIONS"] = "-Xmx2G"
+    env["_JAVA_OPTIONS"] = f"-Xmx{heap_mb}m"
     
     try:
         print(f"Processing chunk {start_commit[:8]}-{end_commit[:8]}")
         result = subprocess.run(command, capture_output=True, text=True, env=env)
-        if result.returncode == 0:
+        if result.returncode == 0 and os.path.exists(tmp_output):
+            os.replace(tmp_output, chunk_output)
             print(f"Chunk {start_commit[:8]}-{end_commit[:8]} finished ({counter}/{total_chunks})")
             return chunk_output
         else:
@@ -107,22 +254,184 @@ def run_refactoring_miner_chunk(args):
         print(f"Exception processing chunk {start_commit[:8]}-{end_commit[:8]}: {str(e)}")
         return None
  
-def merge_json_results(json_files, output_file):
+# Long-lived RefactoringMiner JVM of the current pool process, see RefactoringMinerWorker.java
+_worker = None
 
-    print("Merging chunks...")
+def compile_refactoring_miner_worker():
+    """Compile RefactoringMinerWorker.java against RefactoringMiner's jars if it is not up to date"""
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "java", "RefactoringMinerWorker.java")
+    build_dir = os.path.join(os.getcwd(), "cache", "rm_worker")
+    class_file = os.path.join(build_dir, "RefactoringMinerWorker.class")
 
-    merged_commits = []
-    
-    for json_file in json_files:
+    if os.path.exists(class_file) and os.path.getmtime(class_file) >= os.path.getmtime(source):
+        return build_dir
 
-        if not json_file:
-            continue
+    os.makedirs(build_dir, exist_ok=True)
+    classpath = os.path.join(get_refactoring_miner_dir(), "lib", "*")
+    result = subprocess.run(["javac", "-cp", classpath, "-d", build_dir, source], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Failed to compile the RefactoringMiner worker: {result.stderr}")
+
+    return build_dir
+
+def stop_refactoring_miner_worker():
+    global _worker
+    if _worker and _worker.poll() is None:
+        _worker.stdin.close()
+        try:
+            _worker.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            _worker.kill()
+    _worker = None
+
+def start_refactoring_miner_worker(repo_path, heap_mb, build_dir):
+    """Start the JVM of this process, which keeps RefactoringMiner and the repository open"""
+    global _worker
+    classpath = os.pathsep.join([build_dir, os.path.join(get_refactoring_miner_dir(), "lib", "*")])
+    command = ["java", f"-Xmx{heap_mb}m", "-cp", classpath, "RefactoringMinerWorker", os.path.join(os.getcwd(), repo_path)]
+
+    _worker = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        encoding="utf-8"
+    )
+    # No explicit shutdown is needed: the JVM stops on EOF when the pool process exits and its stdin is closed
+
+def mine_with_worker(commits):
+    """Send commits to the JVM of this process and return the commits it found refactorings in"""
+    _worker.stdin.write(" ".join(commits) + "\n")
+    _worker.stdin.flush()
+
+    mined = []
+    while True:
+        line = _worker.stdout.readline()
+        if not line:
+            raise Exception("RefactoringMiner worker exited")
+        if line.strip() == "END":
+            return mined
+        mined.append(json.loads(line))
+
+def check_refactoring_miner_worker(repo_path, heap_mb=MIN_HEAP_MB):
+    """
+    Smoke test of the worker mode: build the worker, start it on the repo and mine its HEAD commit.
+    Return True if it answered like RefactoringMiner's -json output
+    """
+    head = subprocess.run(["git", "-C", repo_path, "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    try:
+        start_refactoring_miner_worker(repo_path, heap_mb, compile_refactoring_miner_worker())
+        mined = mine_with_worker([head])
+    except Exception as e:
+        print(f"[RefactoringMiner worker check failed] : {e}")
+        return False
+    finally:
+        stop_refactoring_miner_worker()
 
-        if json_file and os.path.exists(json_file):
-            with open(json_file, 'r') as f:
-                data = json.load(f)
-                merged_commits.extend(data.get('commits', []))
-            os.remove(json_file)  # Clean up chunk files
+    if any(commit.get("sha1") != head or "refactorings" not in commit for commit in mined):
+        print(f"[RefactoringMiner worker check failed] : unexpected output {mined}")
+        return False
+    print(f"[RefactoringMiner worker check] : {head[:8]} mined, {len(mined)} commit with refactorings")
+    return True
+
+def run_refactoring_miner_worker_chunk(args):
+    """Same as run_refactoring_miner_chunk, but sends the commits to the long-lived JVM of this pool process"""
+    counter, total_chunks, repo_path, result_dir_path, start_commit, end_commit, heap_mb, commits = args
+
+    chunk_output = os.path.join(os.getcwd(), result_dir_path, f"chunk_{start_commit[:8]}_{end_commit[:8]}.json")
+
+    if os.path.exists(chunk_output):
+        print(f"Skipping chunk {start_commit[:8]}-{end_commit[:8]} as it was already processed")
+        return chunk_output
+
+    if not os.path.exists(os.path.dirname(chunk_output)):
+        print(f"{os.path.dirname(chunk_output)} does not exist. Creating it...")
+        os.makedirs(os.path.dirname(chunk_output), exist_ok=True)
+
+    try:
+        # The JVM is started by the first chunk of this process, which the scheduler only submits when
+        # there is memory for it, and restarted if it died while processing a previous chunk
+        if _worker is None or _worker.poll() is not None:
+            start_refactoring_miner_worker(repo_path, heap_mb, compile_refactoring_miner_worker())
+
+        print(f"Processing chunk {start_commit[:8]}-{end_commit[:8]}")
+        chunk_commits = mine_with_worker(commits)
+
+        # Same format as RefactoringMiner's -json output, written atomically
+        with open(chunk_output + ".tmp", "w") as f:
+            json.dump({"commits": chunk_commits}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(chunk_output + ".tmp", chunk_output)
+
+        print(f"Chunk {start_commit[:8]}-{end_commit[:8]} finished ({counter}/{total_chunks})")
+        return chunk_output
+    except Exception as e:
+        print(f"Exception processing chunk {start_commit[:8]}-{end_commit[:8]}: {str(e)}")
+        stop_refactoring_miner_worker()
+        return None
+
+def fsync_directory(path):
+    """Make a rename in a directory durable, not supported on Windows"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+MERGED_PREFIX = '{"commits": ['
+MERGED_SUFFIX = ']}'
+
+def copy_merged_commits(merged_file, f):
+    """
+    Stream the commits already merged in merged_file into f, without parsing them when the file was written
+    by merge_json_results (json.dump only writes ASCII). Return True if any commit was copied
+    """
+    if not os.path.exists(merged_file):
+        return False
+
+    size = os.path.getsize(merged_file)
+    with open(merged_file, 'rb') as merged:
+        prefix = merged.read(len(MERGED_PREFIX))
+        merged.seek(max(0, size - len(MERGED_SUFFIX)))
+        suffix = merged.read()
+
+        if prefix != MERGED_PREFIX.encode() or suffix != MERGED_SUFFIX.encode():
+            # Written by something else, read it as plain JSON
+            merged.seek(0)
+            commits = json.load(merged).get('commits', [])
+            for i, commit in enumerate(commits):
+                if i:
+                    f.write(', ')
+                json.dump(commit, f)
+            return bool(commits)
+
+        # Everything between the prefix and the suffix is the comma separated commits
+        merged.seek(len(MERGED_PREFIX))
+        remaining = size - len(MERGED_PREFIX) - len(MERGED_SUFFIX)
+        copied = False
+        while remaining > 0:
+            block = merged.read(min(remaining, 1 << 20))
+            if not block:
+                break
+            f.write(block.decode('ascii'))
+            remaining -= len(block)
+            copied = True
+        return copied
+
+def merge_json_results(json_files, output_file):
+    """
+    Stream the commits of every chunk into output_file, after the commits it already holds from previous runs,
+    holding a single chunk in memory at a time. Return the chunk files that were merged.
+    output_file is only replaced once it is durably on disk, so a crash while merging loses nothing
+    """
+    print("Merging chunks...")
 
     if not os.path.exists(os.path.dirname(output_file)):
         print(f"{os.path.dirname(output_file)} does not exist. Creating it...")
@@ -130,62 +439,157 @@ def merge_json_results(json_files, output_file):
 
     print(f"Dumping commits to {output_file}")
 
-    with open(output_file, 'w+') as f:
-        json.dump({'commits': merged_commits}, f)
+    # Write to a temporary file that replaces output_file only once it is complete
+    tmp_output = output_file + ".tmp"
+    merged_files = []
+    total_commits = 0
+
+    with open(tmp_output, 'w') as f:
+        f.write(MERGED_PREFIX)
+        # Commits merged by previous runs are not in any chunk anymore
+        has_commits = copy_merged_commits(output_file, f)
+
+        for json_file in json_files:
+
+            if not json_file or not os.path.exists(json_file):
+                continue
+
+            with open(json_file, 'r') as chunk:
+                commits = json.load(chunk).get('commits', [])
+
+            for commit in commits:
+                if has_commits:
+                    f.write(', ')
+                json.dump(commit, f)
+                has_commits = True
+                total_commits += 1
+
+            merged_files.append(json_file)
+
+        f.write(MERGED_SUFFIX)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_output, output_file)
+    fsync_directory(os.path.dirname(output_file))
+
+    print(f"Merged {total_commits} commits from {len(merged_files)} chunks")
+    return merged_files
  
-def run_refactoring_miner(repo_path, result_dir_path):
-    # Create chunks of commits
-    commit_chunks = chunk_commits(repo_path, result_dir_path, chunk_size=100)
+def plan_refactoring_miner(reserve_mb=2048, max_workers=None, heap_mb=None):
+    """
+    Choose how many RefactoringMiner JVMs to run at once and the heap of each one
+    from the available cores and free memory. A given worker count is only an upper bound,
+    a given heap is kept and fewer workers are run if their heaps do not fit in memory
+    """
+    num_workers = Resources.plan_workers(int((heap_mb or DEFAULT_HEAP_MB) * JVM_OVERHEAD), reserve_mb, max_workers)
+    if heap_mb:
+        return num_workers, heap_mb
+
+    # Share the free memory between the workers, within the heap bounds
+    free_mb = Resources.available_memory_mb() - reserve_mb
+    heap_mb = int(free_mb / num_workers / JVM_OVERHEAD)
+    heap_mb = max(MIN_HEAP_MB, min(MAX_HEAP_MB, heap_mb))
+
+    return num_workers, heap_mb
+
+def run_refactoring_miner(repo_path, result_dir_path, num_workers=None, heap_mb=None, reserve_mb=2048, worker_mode=False):
+    """
+    Mine all the commits of a repo chunk by chunk. In worker_mode, every pool process keeps one RefactoringMiner JVM
+    alive for all its chunks instead of starting a new one per chunk
+    """
+    # Create chunks of commits that the progress ledger does not know yet
+    ledger = ProgressLedger.open_ledger(result_dir_path)
+    commit_chunks = chunk_commits(repo_path, result_dir_path, ledger, chunk_size=100)
 
     total_chunks = len(commit_chunks)
     counter = 1
+
+    # Pick the concurrency and the heap of every JVM from the machine, a given number of workers
+    # is capped by the free memory like the planned one
+    num_workers, heap_mb = plan_refactoring_miner(reserve_mb, num_workers, heap_mb)
     
     # Prepare arguments for parallel processing
     chunk_args = []
     for i in range(total_chunks):
-        start_commit = commit_chunks[i][0]
-        end_commit = commit_chunks[i][-1]
-        chunk_args.append((counter, total_chunks, repo_path, result_dir_path, start_commit, end_commit))
+        position, commits, _ = commit_chunks[i]
+        chunk_args.append((counter, total_chunks, repo_path, result_dir_path, commits[0], commits[-1], heap_mb, commits))
         counter += 1
 
-    # Calculate optimal number of workers based on CPU cores and memory
-    # 1 for now to let the script run in the background
-    num_workers = 1 #min(os.cpu_count() or 1, 1)  # Limit to 4 parallel processes
-
-    print(f"Processing {total_chunks} chunks with {num_workers} workers...")
+    print(f"Processing {total_chunks} chunks with up to {num_workers} workers and {heap_mb} MB of heap each...")
     
-    # Process chunks in parallel
-    chunk_results = []
+    # Process chunks in parallel. Chunks are submitted one by one so that no new JVM
+    # is started while the system is under memory pressure
+    chunk_results = [None] * total_chunks
+    # Most expensive chunks first, so that none of them is left running alone at the end
+    pending = sorted(range(total_chunks), key=lambda i: -commit_chunks[i][2])
+    running = {}
+    # The worker mode is only used once it was built and answered on this repo,
+    # otherwise every chunk starts RefactoringMiner's own launcher
+    if worker_mode and not check_refactoring_miner_worker(repo_path):
+        print("Falling back to one RefactoringMiner process per chunk")
+        worker_mode = False
+    chunk_function = run_refactoring_miner_worker_chunk if worker_mode else run_refactoring_miner_chunk
+
     with ProcessPoolExecutor(max_workers=num_workers) as executor:
-        chunk_results = list(executor.map(run_refactoring_miner_chunk, chunk_args))
+        while pending or running:
+            while pending and len(running) < num_workers:
+                if running and Resources.under_memory_pressure(heap_mb * JVM_OVERHEAD, reserve_mb):
+                    print(f"Memory pressure, waiting before starting a new chunk ({len(running)} running)")
+                    break
+                i = pending.pop(0)
+                running[executor.submit(chunk_function, chunk_args[i])] = i
+
+            print(Resources.utilisation_report(len(running), num_workers))
+
+            done, _ = wait(running, timeout=60, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                chunk_results[i] = future.result()
+
+                # Only the main process writes to the ledger
+                if chunk_results[i]:
+                    position, commits, _ = commit_chunks[i]
+                    ProgressLedger.record_chunk(ledger, os.path.basename(chunk_results[i]), position, commits)
     
-    # Merge results
+    # Merge results, including the chunks finished by previous runs
     final_output = os.path.join(result_dir_path, "ListOfRefactoringCommits.json")
-    merge_json_results(chunk_results, final_output)
+    chunk_files = ProgressLedger.unmerged_chunks(ledger)
+    merged_files = merge_json_results([os.path.join(result_dir_path, chunk_file) for chunk_file in chunk_files],
+                                      final_output)
+    # The merged file now holds their commits, so they must never be merged again: they are marked merged
+    # before they are deleted
+    ProgressLedger.mark_merged(ledger, chunk_files)
+    for json_file in merged_files:
+        os.remove(json_file)
+    ledger.close()
  
 # Rest of the code remains the same, starting from parse_refactoring_results...
  
  
-def parse_refactoring_results(repo_path, json_file):
+def parse_refactoring_results(repo_path, json_file, timestamp_index=None):
     with open(json_file, 'r') as f:
         data = json.load(f)
-    
+
+    # Commit dates come from the commit table of the project, which covers every branch
+    if timestamp_index is None:
+        timestamp_index = CommitTable.get_commit_dates(
+            repo_path, [commit.get('sha1') for commit in data['commits'] if commit.get('sha1')]
+        )
+
     refactoring_counts = defaultdict(int)
     refactoring_times = []
     
     for commit in data['commits']:
         for refactoring in commit.get('refactorings', []):
             refactoring_counts[refactoring['type']] += 1
-        
-        get_commit_timestamp_command = ["git", "-C", repo_path, "log", "-1", f"--format=%ci", commit.get('sha1')]
- 
-        result = subprocess.run(get_commit_timestamp_command, capture_output=True, text=True)
- 
-        if result.returncode == 0:
-            timestamp = result.stdout.strip()
+
+        timestamp = timestamp_index.get(commit.get('sha1'))
+
+        if timestamp:
             refactoring_times.append(timestamp)
         else:
-            print(f"Error retrieving timestamp for commit {commit.get('sha1')}: {result.stderr}")
+            print(f"Error retrieving timestamp for commit {commit.get('sha1')}: unknown commit")
     
     return refactoring_counts, refactoring_times
  
@@ -205,8 +609,8 @@ def calculate_average_time_between_refactorings(times):
  
     return average_time_delta
  
-def analyze_project(project_path, result_dir_path):
-    run_refactoring_miner(project_path, result_dir_path)
+def analyze_project(project_path, result_dir_path, worker_mode=False, num_workers=None, heap_mb=None):
+    run_refactoring_miner(project_path, result_dir_path, num_workers=num_workers, heap_mb=heap_mb, worker_mode=worker_mode)
  
     json_file = os.path.join(result_dir_path, "ListOfRefactoringCommits.json")
 
@@ -220,51 +624,69 @@ def analyze_project(project_path, result_dir_path):
     avg_time = calculate_average_time_between_refactorings(times)
  
     return counts, total_refactorings, avg_time
- 
-def run():
-    
-    repos_dir = "repos"
-    results_dir = "results"
 
-    with open("repos_names.json", "r") as f:
-        project_names = json.load(f)
+def run_project(project, worker_mode=False, num_workers=None, heap_mb=None, repos_dir="repos", results_dir="results"):
+    """
+    Mine the refactorings of a single project, unless it was already processed
+    """
+    project_path = os.path.join(repos_dir, project)
+    result_dir_path = os.path.join(results_dir, project)
 
-    for project in os.listdir(repos_dir):
+    # Exclude projects that were already processed
+    if os.path.exists(os.path.join(result_dir_path, "ListOfRefactoringCommits.json")):
+        return
 
-        result_dir_path = os.path.join(results_dir, project)
+    if os.path.isdir(project_path):
+        print(f"[Refactoring Mining] : {project}...")
 
-        # Exclude projects that were already processed
-        if os.path.exists(result_dir_path):
-            if os.path.exists(os.path.join(result_dir_path, "ListOfRefactoringCommits.json")):
-                continue
+        start = time.time()
 
-        if project not in project_names:
-            continue
+        counts, total, avg_time = analyze_project(project_path, result_dir_path, worker_mode, num_workers, heap_mb)
 
-        project_path = os.path.join(repos_dir, project)
-        result_dir_path = os.path.join(results_dir, project)
+        project_results = {
+            "counts": counts,
+            "total": total,
+            "avg_time": avg_time
+        }
 
-        if os.path.isdir(project_path):
-            print(f"[Refactoring Mining] : {project}...")
+        out_path = os.path.join(result_dir_path, "RMining_results.json")
+        print(f"Writing refactoring mining results of {project} to {out_path}")
+        with open(out_path, "w+") as f:
+            json.dump(project_results, f, indent=4)
 
-            start = time.time()
+        end = time.time()
 
-            counts, total, avg_time = analyze_project(project_path, result_dir_path)
+        print(f"Processing {project} took {time.strftime('%H:%M:%S', time.gmtime(end - start))}")
+ 
+def run(worker_mode=False):
+    
+    repos_dir = "repos"
+    results_dir = "results"
 
-            project_results = {
-                "counts": counts,
-                "total": total,
-                "avg_time": avg_time
-            }
+    with open("repos_names.json", "r") as f:
+        project_names = json.load(f)
 
-            out_path = os.path.join(result_dir_path, "RMining_results.json")
-            print(f"Writing refactoring mining results of {project} to {out_path}")
-            with open(out_path, "w+") as f:
-                json.dump(project_results, f, indent=4)
+    for project in os.listdir(repos_dir):
 
-            end = time.time()
+        if project not in project_names:
+            continue
 
-            print(f"Processing {project} took {time.strftime('%H:%M:%S', time.gmtime(end - start))}")
+        run_project(project, worker_mode, repos_dir=repos_dir, results_dir=results_dir)
  
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="RefactoringMiner stage")
+    parser.add_argument("--worker-mode", action="store_true",
+                        help="keep one RefactoringMiner JVM per worker process, see check-worker")
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser("build-worker", help="compile src/java/RefactoringMinerWorker.java into cache/rm_worker")
+    check_parser = subparsers.add_parser("check-worker", help="build the worker and mine the HEAD commit of a repo with it")
+    check_parser.add_argument("project", help="project name in the repos directory, e.g. ant.git")
+
+    args = parser.parse_args()
+    if args.command == "build-worker":
+        print(f"RefactoringMiner worker built in {compile_refactoring_miner_worker()}")
+    elif args.command == "check-worker":
+        sys.exit(0 if check_refactoring_miner_worker(os.path.join("repos", args.project)) else 1)
+    else:
+        run(args.worker_mode)
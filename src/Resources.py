@@ -0,0 +1,61 @@
+import os
+
+def cpu_count():
+    """
+    Cores this process is allowed to run on
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def _meminfo():
+    meminfo = {}
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                meminfo[name] = int(value.split()[0]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return meminfo
+
+def total_memory_mb():
+    meminfo = _meminfo()
+    if "MemTotal" in meminfo:
+        return meminfo["MemTotal"]
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+
+def available_memory_mb():
+    """
+    Memory that can be used without swapping (MemAvailable on Linux)
+    """
+    meminfo = _meminfo()
+    if "MemAvailable" in meminfo:
+        return meminfo["MemAvailable"]
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES") // (1024 * 1024)
+
+def plan_workers(worker_memory_mb, reserve_mb=2048, max_workers=None):
+    """
+    Number of workers needing worker_memory_mb each that fit in the free cores and memory,
+    keeping reserve_mb free for the system
+    """
+    by_cpu = cpu_count()
+    by_memory = (available_memory_mb() - reserve_mb) // max(1, worker_memory_mb)
+
+    workers = max(1, min(by_cpu, by_memory))
+    if max_workers:
+        workers = min(workers, max_workers)
+    return workers
+
+def under_memory_pressure(needed_mb, reserve_mb=2048):
+    """
+    True if starting something that needs needed_mb would eat into the reserve
+    """
+    return available_memory_mb() - needed_mb < reserve_mb
+
+def utilisation_report(running, num_workers):
+    load_1, _, _ = os.getloadavg() if hasattr(os, "getloadavg") else (0.0, 0.0, 0.0)
+    used_mb = total_memory_mb() - available_memory_mb()
+    return (f"[Utilisation] : {running}/{num_workers} workers busy, "
+            f"load {load_1:.1f}/{cpu_count()} cores, "
+            f"memory {used_mb}/{total_memory_mb()} MB used")
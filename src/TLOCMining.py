@@ -4,37 +4,37 @@ import json
 import csv
 from collections import defaultdict
 
+from src import LOCCache, BlobLOC, WorktreePool, CommitTable, NumstatLOC
+
+PROGRAMMING_LANGUAGES = {
+    'Java', 'Python', 'C++', 'C#', 'JavaScript', 'PHP', 'C', 'R', 'Swift', 
+    'Go', 'Rust', 'Ruby', 'Kotlin', 'TypeScript'
+}
 
 # Execute scc on a repo folder and return the total lignes of code for recognized programming languages
 def run_scc(repo_path):
+    languages = LOCCache.run_scc_languages(repo_path)
+    if languages is None:
+        return 0
+    return LOCCache.filter_loc(languages, PROGRAMMING_LANGUAGES)
 
-    PROGRAMMING_LANGUAGES = {
-        'Java', 'Python', 'C++', 'C#', 'JavaScript', 'PHP', 'C', 'R', 'Swift', 
-        'Go', 'Rust', 'Ruby', 'Kotlin', 'TypeScript'
-    }
+# Return the LOC of a commit, only checking it out and running scc if it is not in the LOC cache yet.
+# Counts of a sparse checkout are cached apart from the full ones
+def get_commit_loc(repo_path, commit_hash, project=None, sparse=False):
+    project = project or LOCCache.repo_key(repo_path)
 
-    try:
-        result = subprocess.run(
-            ['scc', '--no-cocomo', '--no-complexity', '--format', 'json', repo_path],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
-        languages_data = json.loads(result.stdout)
-        
-        total_loc = 0
-        for lang_data in languages_data:
-            if lang_data.get('Name') in PROGRAMMING_LANGUAGES:
-                total_loc += lang_data.get('Lines', 0)
-                
-        return total_loc
-    except subprocess.CalledProcessError as e:
-        print(f"[SCC error]: {e}")
-        return 0
-    except json.JSONDecodeError as e:
-        print(f"[Json decoding scc error]: {e}")
-        return 0
+    languages = LOCCache.load_languages(project, commit_hash)
+    if languages is None and sparse:
+        languages = LOCCache.load_languages(LOCCache.sparse_key(project), commit_hash)
+    if languages is None:
+        if not checkout_commit(repo_path, commit_hash):
+            return None
+        languages = LOCCache.run_scc_languages(repo_path)
+        if languages is None:
+            return 0
+        LOCCache.save_languages(LOCCache.sparse_key(project) if sparse else project, commit_hash, languages)
+
+    return LOCCache.filter_loc(languages, PROGRAMMING_LANGUAGES)
 
 # Checkout a specific commit in the repo
 def checkout_commit(repo_path, commit_hash):
@@ -54,63 +54,53 @@ def checkout_commit(repo_path, commit_hash):
         print(f"[Checkout error] : {e}")
         return False
 
-def get_previous_commit(repo_path, commit_hash):
-    try:
-        result = subprocess.run(
-            ['git', 'rev-parse', f'{commit_hash}^1'],
-            cwd=repo_path,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        if result.returncode != 0:
-            print(f"[Error getting previous commit hash] : {result.stderr}")
-            return None
-        return result.stdout.strip()
-    except subprocess.SubprocessError as e:
-        print(f"[git rev-parse error]: {e}")
-        return None
+# Parent and author come from the commit table of the project
+def get_previous_commit(repo_path, commit_hash, project=None):
+    previous_hash = CommitTable.get_first_parent(repo_path, commit_hash, project)
+    if previous_hash is None:
+        print(f"[Error getting previous commit hash] : {commit_hash}")
+    return previous_hash
 
-def get_commit_author(repo_path, commit_hash):
-    try:
-        result = subprocess.run(
-            ['git', 'log', '-1', '--pretty=format:%an', commit_hash],
-            cwd=repo_path,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        if result.returncode != 0:
-            print(f"[Error getting author] : {commit_hash} : {result.stderr}")
-            return None
-        return result.stdout.strip()
-    except subprocess.SubprocessError as e:
-        print(f"[Git log error]: {e}")
-        return None
+def get_commit_author(repo_path, commit_hash, project=None):
+    author = CommitTable.get_author(repo_path, commit_hash, project)
+    if author is None:
+        print(f"[Error getting author] : {commit_hash}")
+    return author
 
-def analyze_commit_effort(repo_path, commit_hash):
-    # Checkout refactoring commit
-    if not checkout_commit(repo_path, commit_hash):
-        return 0, None, None
-        
-    current_loc = run_scc(repo_path)
-    
-    # Get and checkout the previous commit
-    previous_hash = get_previous_commit(repo_path, commit_hash)
+def analyze_commit_effort(repo_path, commit_hash, project=None, tloc_mode="scc", sparse=False):
+    # Get the previous commit, no checkout is needed for that
+    previous_hash = get_previous_commit(repo_path, commit_hash, project)
     if not previous_hash:
         return 0, None, None
-        
-    if not checkout_commit(repo_path, previous_hash):
-        return 0, None, None
-        
-    previous_loc = run_scc(repo_path)
+
+    if tloc_mode == "blobs":
+        # Only count the blobs changed by the commit, read from the object store without any checkout
+        loc_delta = BlobLOC.diff_loc(repo_path, previous_hash, commit_hash, PROGRAMMING_LANGUAGES)
+        if loc_delta is None:
+            return 0, None, None
+    else:
+        current_loc = get_commit_loc(repo_path, commit_hash, project, sparse)
+        if current_loc is None:
+            return 0, None, None
+
+        previous_loc = get_commit_loc(repo_path, previous_hash, project, sparse)
+        if previous_loc is None:
+            return 0, None, None
+
+        loc_delta = current_loc - previous_loc
     
     # Retrieve the author of the current commit
-    author = get_commit_author(repo_path, commit_hash)
+    author = get_commit_author(repo_path, commit_hash, project)
     
-    return abs(current_loc - previous_loc), previous_hash, author
+    return abs(loc_delta), previous_hash, author
+
+# Worker task of the worktree pool, the LOC cache key must stay the project name and not the worktree one
+def commit_effort_task(worktree_path, args):
+    commit_hash, project, tloc_mode, sparse = args
+    return analyze_commit_effort(worktree_path, commit_hash, project, tloc_mode, sparse)
 
-def analyze_developer_effort(refactoring_results_path, repo_path, output_csv_path):
+def analyze_developer_effort(refactoring_results_path, repo_path, output_csv_path, tloc_mode="scc",
+                             num_workers=1, worktree_dir=None, sparse=False):
     try:
         with open(refactoring_results_path, 'r') as f:
             data = json.load(f)
@@ -121,13 +111,32 @@ def analyze_developer_effort(refactoring_results_path, repo_path, output_csv_pat
     csv_data = []
     
     try:
-        for commit in data.get('commits', []):
-            commit_hash = commit.get('sha1')
-            if not commit_hash:
-                continue
-            
-            tloc, previous_hash, author = analyze_commit_effort(repo_path, commit_hash)
-            
+        commit_hashes = [commit.get('sha1') for commit in data.get('commits', []) if commit.get('sha1')]
+
+        if tloc_mode == "numstat":
+            # Line deltas of all the commits from one git log --numstat, no tree is ever counted
+            tlocs = NumstatLOC.numstat_tlocs(repo_path, commit_hashes, PROGRAMMING_LANGUAGES)
+            authors = CommitTable.get_authors(repo_path, commit_hashes)
+            efforts = [
+                (tlocs[commit_hash][0], tlocs[commit_hash][1], authors.get(commit_hash)) if commit_hash in tlocs
+                else (0, None, None)
+                for commit_hash in commit_hashes
+            ]
+        elif num_workers > 1:
+            # Every worker checks out commits in its own worktree, the main clone is never touched
+            project = LOCCache.repo_key(repo_path)
+            efforts = WorktreePool.run_on_worktrees(
+                repo_path,
+                [(commit_hash, project, tloc_mode, sparse) for commit_hash in commit_hashes],
+                commit_effort_task,
+                num_workers,
+                worktree_dir,
+                sparse
+            )
+        else:
+            efforts = [analyze_commit_effort(repo_path, commit_hash, tloc_mode=tloc_mode) for commit_hash in commit_hashes]
+
+        for commit_hash, (tloc, previous_hash, author) in zip(commit_hashes, efforts):
             csv_data.append({
                 'refactoring_hash': commit_hash,
                 'previous_hash': previous_hash if previous_hash else 'N/A',
@@ -135,8 +144,8 @@ def analyze_developer_effort(refactoring_results_path, repo_path, output_csv_pat
                 'TLOC': tloc
             })
         
-        # Get back to head
-        if not checkout_commit(repo_path, 'HEAD'):
+        # Get back to head, the blobs mode and the worktree pool never leave it
+        if tloc_mode == "scc" and num_workers <= 1 and not checkout_commit(repo_path, 'HEAD'):
             print("Impossible to reset to HEAD")
         
         with open(output_csv_path, 'w', newline='') as csvfile:
@@ -149,27 +158,36 @@ def analyze_developer_effort(refactoring_results_path, repo_path, output_csv_pat
             
     except Exception as e:
         print(f"[Error analysing] : {e}")
-        checkout_commit(repo_path, 'HEAD')
+        if tloc_mode == "scc" and num_workers <= 1:
+            checkout_commit(repo_path, 'HEAD')
+
+def run_project(project, tloc_mode="scc", num_workers=1, worktree_dir=None, sparse=False,
+                repos_dir="repos", results_dir="results"):
+    project_path = os.path.join(repos_dir, project)
+    if not os.path.isdir(project_path):
+        return
+        
+    print(f"\n[Analysing effort] : {project}...")
+    
+    refactoring_results = os.path.join(results_dir, project, "ListOfRefactoringCommits.json")
+    if not os.path.exists(refactoring_results):
+        print(f"[No results found] : {project}")
+        return
+    
+    # Créer le fichier CSV dans le même répertoire que les résultats
+    output_csv = os.path.join(results_dir, project, "TLOC_mining.csv")
+    analyze_developer_effort(refactoring_results, project_path, output_csv, tloc_mode,
+                             num_workers, worktree_dir, sparse)
 
-def run():
+# tloc_mode is either "scc" (checkout and count whole trees), "blobs" (count only the changed blobs)
+# or "numstat" (lines added and deleted by the commits, see NumstatLOC.validate for how close it is to scc)
+# With num_workers > 1, commits are spread over a pool of git worktrees created in worktree_dir (e.g. /dev/shm)
+def run(tloc_mode="scc", num_workers=1, worktree_dir=None, sparse=False):
     repos_dir = "repos"
     results_dir = "results"
     
     for project in os.listdir(repos_dir):
-        project_path = os.path.join(repos_dir, project)
-        if not os.path.isdir(project_path):
-            continue
-            
-        print(f"\n[Analysing effort] : {project}...")
-        
-        refactoring_results = os.path.join(results_dir, project, "ListOfRefactoringCommits.json")
-        if not os.path.exists(refactoring_results):
-            print(f"[No results found] : {project}")
-            continue
-        
-        # Créer le fichier CSV dans le même répertoire que les résultats
-        output_csv = os.path.join(results_dir, project, "TLOC_mining.csv")
-        analyze_developer_effort(refactoring_results, project_path, output_csv)
+        run_project(project, tloc_mode, num_workers, worktree_dir, sparse, repos_dir, results_dir)
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from src.Languages import SCC_EXTENSIONS
+
+def create_worktree(repo_path, worktree_path, sparse=False):
+    """
+    Add a detached worktree of the repo without checking anything out, so the main clone is left untouched.
+    With sparse, only files of the languages known to scc are ever checked out in it
+    """
+    process = subprocess.run(
+        ['git', 'worktree', 'add', '--detach', '--no-checkout', worktree_path, 'HEAD'],
+        cwd=repo_path,
+        capture_output=True,
+        text=True
+    )
+    if process.returncode != 0:
+        raise Exception(f"Failed to create worktree {worktree_path}: {process.stderr}")
+
+    if sparse:
+        patterns = sorted({f"*.{ext.split('.')[-1]}" for ext in SCC_EXTENSIONS})
+        process = subprocess.run(
+            ['git', 'sparse-checkout', 'set', '--no-cone'] + patterns,
+            cwd=worktree_path,
+            capture_output=True,
+            text=True
+        )
+        if process.returncode != 0:
+            print(f"[Sparse checkout error] : {worktree_path} : {process.stderr}")
+
+def remove_worktree(repo_path, worktree_path):
+    subprocess.run(['git', 'worktree', 'remove', '--force', worktree_path], cwd=repo_path, capture_output=True)
+    if os.path.exists(worktree_path):
+        shutil.rmtree(worktree_path, ignore_errors=True)
+
+def _run_slice(task, worktree_path, indexed_items):
+    return [(i, task(worktree_path, item)) for i, item in indexed_items]
+
+def run_on_worktrees(repo_path, items, task, num_workers, base_dir=None, sparse=False):
+    """
+    Call task(worktree_path, item) for every item, spread over num_workers processes that each own a worktree.
+    base_dir is where the worktrees are created, e.g. /dev/shm to keep them on tmpfs.
+    Results are returned in the same order as items
+    """
+    if not items:
+        return []
+
+    num_workers = max(1, min(num_workers, len(items)))
+    pool_dir = tempfile.mkdtemp(prefix=f"{os.path.basename(os.path.normpath(repo_path))}_", dir=base_dir)
+    worktrees = [os.path.join(pool_dir, f"worker_{i}") for i in range(num_workers)]
+
+    results = [None] * len(items)
+    try:
+        for worktree_path in worktrees:
+            create_worktree(repo_path, worktree_path, sparse)
+
+        # Contiguous slices, so that consecutive commits (and their shared parents) land on the same worktree
+        # and every checkout only has to update a few files
+        indexed_items = list(enumerate(items))
+        slice_size = -(-len(items) // num_workers)
+        slices = [indexed_items[i:i + slice_size] for i in range(0, len(items), slice_size)]
+
+        print(f"Processing {len(items)} commits with {num_workers} worktrees in {pool_dir}...")
+
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = [executor.submit(_run_slice, task, worktree_path, indexed_slice)
+                       for worktree_path, indexed_slice in zip(worktrees, slices)]
+            for future in futures:
+                for i, result in future.result():
+                    results[i] = result
+    finally:
+        for worktree_path in worktrees:
+            remove_worktree(repo_path, worktree_path)
+        subprocess.run(['git', 'worktree', 'prune'], cwd=repo_path, capture_output=True)
+        shutil.rmtree(pool_dir, ignore_errors=True)
+
+    return results
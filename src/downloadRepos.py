@@ -1,37 +1,120 @@
 import json
 import subprocess
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def clone_repo(repo_name, target_dir, result_dir):
-    try:
-        repo_dir = os.path.join(target_dir, repo_name)
-        print(f"Cloning {repo_name} into {repo_dir}")
-        
-        subprocess.run(["git", "clone", "--single-branch", f"https://github.com/apache/{repo_name}", repo_dir], check=True)
+from src import prepareRepos
+
+# Clones and fetches running at once
+MAX_WORKERS = 4
+
+# full: complete clone of the default branch
+# blobless: partial clone, file contents are only downloaded when a checkout or a diff needs them.
+#           RefactoringMiner reads the repo through JGit, which cannot fetch missing blobs
+# mirror: bare clone of every ref, for the tools that only read the object store
+CLONE_ARGS = {
+    "full": ["--single-branch"],
+    "blobless": ["--filter=blob:none"],
+    "mirror": ["--mirror"],
+}
+
+def get_repo_url(repo_name, repos=None):
+    """
+    Url of a repo from the json file (or dict) of repos, the apache/ one if the file has no url for it
+    """
+    if repos is None and os.path.exists("repos_names.json"):
+        repos = load_repos_from_json("repos_names.json")
+    if isinstance(repos, dict) and isinstance(repos.get(repo_name), str) and "/" in repos[repo_name]:
+        return repos[repo_name]
+    return f"https://github.com/apache/{repo_name}"
+
+def dir_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+def is_bare(repo_dir):
+    process = subprocess.run(["git", "rev-parse", "--is-bare-repository"], cwd=repo_dir, capture_output=True, text=True)
+    return process.stdout.strip() == "true"
+
+def sync_repo(repo_name, url, target_dir, mode="full"):
+    """
+    Clone a repo, or fetch it if it is already there.
+    Return (repo_name, action, bytes added on disk, seconds, success)
+    """
+    repo_dir = os.path.join(target_dir, repo_name)
+    start = time.time()
+    size_before = dir_size(repo_dir) if os.path.isdir(repo_dir) else 0
 
+    try:
+        if os.path.isdir(repo_dir):
+            action = "fetch"
+            print(f"Fetching {repo_name} in {repo_dir}")
+            subprocess.run(["git", "fetch", "--prune", "--quiet"], cwd=repo_dir, check=True)
+            # Move the checked out branch to what was fetched, unless it diverged or HEAD is detached
+            if not is_bare(repo_dir):
+                process = subprocess.run(["git", "merge", "--ff-only", "--quiet", "@{upstream}"],
+                                         cwd=repo_dir, capture_output=True, text=True)
+                if process.returncode != 0:
+                    print(f"Fetched {repo_name} without updating its checkout: {process.stderr.strip()}")
+        else:
+            action = "clone"
+            print(f"Cloning {repo_name} into {repo_dir}")
+            subprocess.run(["git", "clone", "--quiet"] + CLONE_ARGS[mode] + [url, repo_dir], check=True)
+        success = True
     except subprocess.CalledProcessError as e:
-        print(f"Failed to clone {repo_name}: {e}")
+        print(f"Failed to {action} {repo_name}: {e}")
+        success = False
+
+    size = dir_size(repo_dir) if os.path.isdir(repo_dir) else 0
+    return repo_name, action, size - size_before, time.time() - start, success
+
+def clone_repo(repo_name, target_dir, result_dir, url=None, mode="full"):
+    return sync_repo(repo_name, url or get_repo_url(repo_name), target_dir, mode)[4]
 
 def load_repos_from_json(file_path):
     with open(file_path, 'r') as file:
         return json.load(file)
     
-# Clone all the repos
-def clone_all_repos(json_file, target_dir, result_dir, amount_of_repo=None, starting_repo=None):
+# Clone all the repos, and fetch the ones that were already cloned
+# With prepare, the repos are then repacked and get a commit-graph (see prepareRepos)
+def clone_all_repos(json_file, target_dir, result_dir, amount_of_repo=None, starting_repo=None, mode="full",
+                    max_workers=MAX_WORKERS, prepare=False):
     repos = load_repos_from_json(json_file)
     if amount_of_repo and starting_repo:
         # select only the repos bewteen "start_repo" and "amount_of_repo" firsts repos
         repos = dict(list(repos.items())[starting_repo:starting_repo+amount_of_repo])
     os.makedirs(target_dir, exist_ok=True)  # Create 'repos' folder if not existing
-    for repo in repos:
-        clone_repo(repo, target_dir, result_dir)
 
-def run():
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda repo: sync_repo(repo, get_repo_url(repo, repos), target_dir, mode), repos))
+
+    for repo_name, action, size, seconds, success in results:
+        status = "ok" if success else "failed"
+        print(f"[{action}] : {repo_name} : {status}, {size / (1024 * 1024):.1f} MB in {seconds:.1f} s")
+
+    total_size = sum(result[2] for result in results)
+    failed = sum(1 for result in results if not result[4])
+    print(f"{len(results)} repos ({failed} failed), {total_size / (1024 * 1024):.1f} MB "
+          f"in {time.time() - start:.1f} s with {max_workers} workers")
+
+    if prepare:
+        prepareRepos.prepare_repos([result[0] for result in results if result[4]], target_dir)
+    return results
+
+def run(mode="full", max_workers=MAX_WORKERS, prepare=False):
     json_file = "repos_names.json"  # URL storage file
     target_directory = "repos"  # Folder where repos will be cloned
     result_dir = "results"
     
-    clone_all_repos(json_file, target_directory, result_dir)
+    clone_all_repos(json_file, target_directory, result_dir, mode=mode, max_workers=max_workers, prepare=prepare)
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run()
@@ -2,19 +2,79 @@ import pandas as pd
 import requests as r
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+URL_CACHE = os.path.join("cache", "url_cache.json")
+# Checked urls are trusted for a week
+URL_CACHE_TTL = 7 * 24 * 3600
+# HEAD requests in flight at once
+MAX_WORKERS = 16
+# Statuses that say for sure whether a project exists. Anything else (rate limits, server errors)
+# may be gone on the next run, so it is never cached
+DEFINITIVE_STATUSES = {200, 404, 410}
+
+def open_session(max_workers=MAX_WORKERS):
+    """
+    Session keeping one connection alive per thread
+    """
+    session = r.Session()
+    adapter = r.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 # Check if url is 404
-def check_url(url):
+def check_url(url, session=r):
     try:
-        response = r.get(url)
-        if response.status_code != 200:
-            return 200
-        else:
-            return response.status_code
+        response = session.head(url, allow_redirects=True, timeout=30)
+        return response.status_code
     except r.exceptions.RequestException as e:
-        print(f"request error")
+        print(f"request error : {url} : {e}")
+        return None
+
+def load_url_cache(cache_file=URL_CACHE):
+    if not os.path.exists(cache_file):
+        return {}
+    with open(cache_file, "r") as f:
+        return json.load(f)
+
+def save_url_cache(cache, cache_file=URL_CACHE):
+    os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+    with open(cache_file + ".tmp", "w") as f:
+        json.dump(cache, f, indent=4)
+    os.replace(cache_file + ".tmp", cache_file)
+
+def check_urls(urls, cache_file=URL_CACHE, ttl=URL_CACHE_TTL, max_workers=MAX_WORKERS):
+    """
+    Status code of every url, from the cache when it was checked less than ttl seconds ago,
+    otherwise with concurrent HEAD requests. Only definitive statuses are cached, the others are checked again
+    on the next call
+    """
+    cache = load_url_cache(cache_file)
+    now = time.time()
+    stale = [url for url in dict.fromkeys(urls) if url not in cache or now - cache[url]["checked_at"] > ttl]
 
-def run():
+    print(f"Checking {len(stale)} urls ({len(cache)} in cache)...")
+    checked = {}
+    if stale:
+        session = open_session(max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            statuses = list(executor.map(lambda url: check_url(url, session), stale))
+        session.close()
+
+        for url, status in zip(stale, statuses):
+            if status in DEFINITIVE_STATUSES:
+                cache[url] = {"status": status, "checked_at": now}
+            else:
+                # An expired answer is still better than a rate limit or an outage, it is kept as is
+                # so the url is checked again next time
+                checked[url] = status
+        save_url_cache(cache, cache_file)
+
+    return {url: cache[url]["status"] if url in cache else checked.get(url) for url in urls}
+
+def run(base_url="https://github.com"):
     file_path = "sonar_measures.csv"
 
     # df without formating data
@@ -31,25 +91,26 @@ def run():
     i=0
     result_dir="results"
 
+    candidates = {}
     for project in project_list:
         if project and  "_" in project:
             owner, name = project.split('_')
-            url = f"https://github.com/{owner}/{name}"
-            check_url = 200
-            if check_url==200:
-                project_urls[owner+"_"+name] = url
-                i+=1
-                print(f"{i}:[Added] : {url}")
+            candidates[owner+"_"+name] = f"{base_url}/{owner}/{name}"
         elif project:
-            url = f"https://github.com/apache/{project}"
-            check_url = 200
-            if check_url==200:
-                project_urls[project] = url
-                i+=1
-                print(f"{i}:[Added] : {url}")
+            candidates[project] = f"{base_url}/apache/{project}"
+
+    statuses = check_urls(list(candidates.values()))
+
+    for project, url in candidates.items():
+        if statuses[url]==200:
+            project_urls[project] = url
+            i+=1
+            print(f"{i}:[Added] : {url}")
+        else:
+            print(f"[Not found] : {url} : {statuses[url]}")
 
     for project in project_urls:
-        os.makedirs(result_dir+"/"+project)
+        os.makedirs(result_dir+"/"+project, exist_ok=True)
 
     jsonObject = json.dumps(project_urls, indent=4)
 
@@ -0,0 +1,86 @@
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+import java.util.List;
+
+import org.eclipse.jgit.lib.Repository;
+import org.refactoringminer.api.GitHistoryRefactoringMiner;
+import org.refactoringminer.api.GitService;
+import org.refactoringminer.api.Refactoring;
+import org.refactoringminer.api.RefactoringHandler;
+import org.refactoringminer.rm1.GitHistoryRefactoringMinerImpl;
+import org.refactoringminer.util.GitServiceImpl;
+
+/**
+ * Long-lived RefactoringMiner process used by RefactoringMining.py in worker mode.
+ *
+ * The repository given as argument is opened once. Every line read on stdin is a
+ * space separated list of commit shas. One JSON object per commit (same shape as
+ * the commits of RefactoringMiner's -json output) is written on stdout, followed
+ * by a line containing END once the whole list was processed.
+ */
+public class RefactoringMinerWorker {
+
+    public static void main(String[] args) throws Exception {
+        // RefactoringMiner logs on stdout, keep stdout for the protocol only
+        PrintStream out = new PrintStream(new FileOutputStream(FileDescriptor.out), true, StandardCharsets.UTF_8);
+        System.setOut(System.err);
+
+        GitService gitService = new GitServiceImpl();
+        GitHistoryRefactoringMiner miner = new GitHistoryRefactoringMinerImpl();
+
+        try (Repository repository = gitService.openRepository(args[0])) {
+            String cloneURL = repository.getConfig().getString("remote", "origin", "url");
+            BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+
+            String line;
+            while ((line = in.readLine()) != null) {
+                for (String commitId : line.trim().split("\\s+")) {
+                    if (commitId.isEmpty()) {
+                        continue;
+                    }
+                    miner.detectAtCommit(repository, commitId, new RefactoringHandler() {
+                        @Override
+                        public void handle(String id, List<Refactoring> refactorings) {
+                            out.println(commitJSON(cloneURL, id, refactorings));
+                        }
+
+                        @Override
+                        public void handleException(String id, Exception e) {
+                            System.err.println("Error processing commit " + id + ": " + e);
+                        }
+                    });
+                }
+                out.println("END");
+            }
+        }
+    }
+
+    private static String commitJSON(String cloneURL, String commitId, List<Refactoring> refactorings) {
+        StringBuilder sb = new StringBuilder();
+        sb.append("{\"repository\": ").append(quote(cloneURL));
+        sb.append(", \"sha1\": ").append(quote(commitId));
+        sb.append(", \"url\": ").append(quote(cloneURL == null ? null
+                : GitHistoryRefactoringMinerImpl.extractCommitURL(cloneURL, commitId)));
+        sb.append(", \"refactorings\": [");
+        for (int i = 0; i < refactorings.size(); i++) {
+            if (i > 0) {
+                sb.append(", ");
+            }
+            sb.append(refactorings.get(i).toJSON());
+        }
+        sb.append("]}");
+        // One commit per line, the JSON of a refactoring spans several lines
+        return sb.toString().replace("\r", " ").replace("\n", " ");
+    }
+
+    private static String quote(String value) {
+        if (value == null) {
+            return "null";
+        }
+        return "\"" + value.replace("\\", "\\\\").replace("\"", "\\\"") + "\"";
+    }
+}
@@ -0,0 +1,98 @@
+import json
+import hashlib
+import subprocess
+import os
+import time
+
+# One file per repo, so that the pipeline can prepare several repos at once
+PREPARE_STATE_DIR = os.path.join("cache", "prepare_state")
+
+def is_partial_clone(repo_dir):
+    """
+    True for clones made with --filter, whose promisor packs cannot get reachability bitmaps
+    """
+    process = subprocess.run(["git", "config", "--get-regexp", r"^(extensions\.partialclone|remote\..*\.promisor)$"],
+                             cwd=repo_dir, capture_output=True, text=True)
+    return any(value not in ("", "false") for _, _, value in (line.partition(" ") for line in process.stdout.splitlines()))
+
+def refs_fingerprint(repo_dir):
+    process = subprocess.run(["git", "for-each-ref", "--format=%(objectname) %(refname)"], cwd=repo_dir,
+                             capture_output=True, text=True)
+    return hashlib.sha1(process.stdout.encode("utf-8")).hexdigest()
+
+def preparation_steps(repo_dir):
+    """
+    git commands making history traversal cheaper for the mining stages:
+    - one pack with a multi-pack-index and reachability bitmaps, for rev-list and object counting
+    - a commit-graph with changed-path Bloom filters, for log and path-limited log
+    """
+    repack = ["git", "repack", "-a", "-d", "--write-midx"]
+    if not is_partial_clone(repo_dir):
+        repack.append("-b")
+    return [
+        ("repack", repack),
+        ("commit-graph", ["git", "commit-graph", "write", "--reachable", "--changed-paths"]),
+    ]
+
+def prepare_repo(repo_dir):
+    """
+    Run the preparation steps on a repo. Return the time taken by each step, or None if one failed
+    """
+    timings = {}
+    for name, command in preparation_steps(repo_dir):
+        start = time.time()
+        process = subprocess.run(command, cwd=repo_dir, capture_output=True, text=True)
+        if process.returncode != 0:
+            print(f"[Preparation error] : {repo_dir} : {name} : {process.stderr.strip()}")
+            return None
+        timings[name] = round(time.time() - start, 2)
+    return timings
+
+def load_state(repo_name, state_dir=PREPARE_STATE_DIR):
+    state_file = os.path.join(state_dir, f"{repo_name}.json")
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, "r") as f:
+        return json.load(f)
+
+def save_state(repo_name, state, state_dir=PREPARE_STATE_DIR):
+    os.makedirs(state_dir, exist_ok=True)
+    state_file = os.path.join(state_dir, f"{repo_name}.json")
+    with open(state_file + ".tmp", "w") as f:
+        json.dump(state, f, indent=4)
+    os.replace(state_file + ".tmp", state_file)
+
+def prepare_repos(repo_names, target_dir="repos", state_dir=PREPARE_STATE_DIR):
+    """
+    Prepare the repos whose refs changed since they were last prepared, and record the timings.
+    Return the names of the repos that could not be prepared
+    """
+    failed = []
+    for repo_name in repo_names:
+        repo_dir = os.path.join(target_dir, repo_name)
+        if not os.path.isdir(repo_dir):
+            continue
+
+        fingerprint = refs_fingerprint(repo_dir)
+        if load_state(repo_name, state_dir).get("refs") == fingerprint:
+            print(f"[Already prepared] : {repo_name}")
+            continue
+
+        print(f"Preparing {repo_name}...")
+        timings = prepare_repo(repo_dir)
+        if timings is None:
+            failed.append(repo_name)
+            continue
+
+        save_state(repo_name, {"refs": fingerprint, "prepared_at": time.time(), "seconds": timings}, state_dir)
+        print(f"[Prepared] : {repo_name} : " + ", ".join(f"{name} {seconds:.1f} s" for name, seconds in timings.items()))
+
+    return failed
+
+def run():
+    target_directory = "repos"
+
+    prepare_repos(sorted(os.listdir(target_directory)), target_directory)
+
+if __name__ == "__main__":
+    run()
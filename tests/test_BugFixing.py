@@ -0,0 +1,267 @@
+import json
+import asyncio
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from src import BugFixing
+
+START = 1000000
+# 1970-01-12T13:46:50Z
+RESET_AT = START + 10
+
+
+def issue_node(number, closer=None):
+    return {
+        "id": f"I_{number}", "databaseId": number, "number": number, "title": f"issue {number}", "body": "",
+        "state": "CLOSED", "stateReason": "COMPLETED", "url": f"https://github.com/owner/proj/issues/{number}",
+        "createdAt": "2024-01-01T00:00:00Z", "updatedAt": f"2024-01-{number:02d}T00:00:00Z",
+        "closedAt": "2024-02-01T00:00:00Z", "author": {"login": "dev"}, "comments": {"totalCount": 0},
+        "labels": {"nodes": [{"name": "bug"}]},
+        "closedByPullRequestsReferences": {"nodes": []},
+        "timelineItems": {"nodes": [{"closer": closer}] if closer else []},
+    }
+
+
+PAGES = {
+    None: {"nodes": [issue_node(3), issue_node(2, {"__typename": "Commit", "oid": "a" * 40})],
+           "pageInfo": {"hasNextPage": True, "endCursor": "c1"},
+           # The first query spends the last points of the token
+           "rateLimit": {"cost": 1, "remaining": 0, "resetAt": "1970-01-12T13:46:50Z"}},
+    "c1": {"nodes": [issue_node(1)],
+           "pageInfo": {"hasNextPage": False, "endCursor": "c2"},
+           "rateLimit": {"cost": 1, "remaining": 4999, "resetAt": "1970-01-12T14:46:50Z"}},
+}
+
+
+class GraphQLHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        variables = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["variables"]
+        self.server.requests.append(variables)
+
+        if variables["repo"] == "missing":
+            payload = {"data": {"repository": None, "rateLimit": {"cost": 1, "remaining": 4000,
+                                                                  "resetAt": "1970-01-12T14:46:50Z"}},
+                       "errors": [{"type": "NOT_FOUND", "message": "Could not resolve to a Repository"}]}
+        else:
+            page = PAGES[variables["cursor"]]
+            payload = {"data": {"rateLimit": page["rateLimit"],
+                                "repository": {"issues": {"nodes": page["nodes"], "pageInfo": page["pageInfo"]}}}}
+
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GraphQLHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Fake time, moved forward by the sleeps of the miner
+    """
+    clock = types.SimpleNamespace(now=START, sleeps=[])
+    real_sleep = asyncio.sleep
+
+    async def sleep(seconds):
+        clock.sleeps.append(seconds)
+        clock.now += seconds
+        await real_sleep(0)
+
+    monkeypatch.setattr(BugFixing, "time", types.SimpleNamespace(time=lambda: clock.now))
+    monkeypatch.setattr(BugFixing.asyncio, "sleep", sleep)
+    return clock
+
+
+def mine(server, results_dir, project):
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    (results_dir / project).mkdir()
+    return asyncio.run(BugFixing.mine_projects([project], BugFixing.TokenPool(["token"]), str(results_dir),
+                                               base_url, backend="graphql"))[project]
+
+
+def test_graphql_pages_and_waits_for_the_points_reset(server, clock, tmp_path):
+    issues = mine(server, tmp_path, "owner_proj")
+
+    assert [issue["number"] for issue in issues] == [3, 2, 1]
+    assert issues[1]["closing_commits"] == ["a" * 40]
+    assert issues[0]["labels"] == [{"name": "bug"}]
+    assert [request["cursor"] for request in server.requests] == [None, "c1"]
+
+    # The second page waited for the reset of the token's points
+    assert clock.sleeps and clock.now >= RESET_AT
+
+    with open(tmp_path / "owner_proj" / "proj_issues.json") as f:
+        assert json.load(f) == issues
+    with open(tmp_path / "owner_proj" / "proj_issues_sync.json") as f:
+        assert json.load(f) == {"since": "2024-01-03T00:00:00Z", "etag": None}
+
+
+def test_graphql_missing_repository(server, clock, tmp_path):
+    assert mine(server, tmp_path, "owner_missing") is None
+    assert len(server.requests) == 1
+    # An empty file marks the project as mined
+    with open(tmp_path / "owner_missing" / "missing_issues.json") as f:
+        assert json.load(f) == []
+    assert not clock.sleeps
+
+
+def rest_issue(number, updated_at="2024-01-01T00:00:00Z"):
+    return {"id": number, "number": number, "title": f"issue {number}", "updated_at": updated_at}
+
+
+# Issues per page of the stand-in REST API
+PAGE_SIZE = 2
+
+
+class RESTHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        token = self.headers.get("Authorization", "").split(" ")[-1]
+        page = int(params.get("page", 1))
+        self.server.requests.append((token, page))
+        self.server.since.append(params.get("since"))
+
+        if token in self.server.spent_tokens:
+            return self.reply(403, {"message": "API rate limit exceeded"},
+                              {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(START + 3600)})
+        failures = self.server.failures.get(page)
+        if failures:
+            return self.reply(failures.pop(0), {"message": "Server Error"})
+
+        issues = [issue for issue in self.server.issues if issue["updated_at"] >= params.get("since", "")]
+        etag = f'"{len(self.server.issues)}-{max(issue["updated_at"] for issue in self.server.issues)}"'
+        if self.headers.get("If-None-Match") == etag:
+            return self.reply(304, None)
+        last = max(1, -(-len(issues) // PAGE_SIZE))
+        headers = {"X-RateLimit-Remaining": "4999", "X-RateLimit-Reset": str(START + 3600), "ETag": etag}
+        if last > 1:
+            base = f"http://127.0.0.1:{self.server.server_address[1]}{url.path}"
+            headers["Link"] = f'<{base}?page={min(page + 1, last)}>; rel="next", <{base}?page={last}>; rel="last"'
+        self.reply(200, issues[(page - 1) * PAGE_SIZE:page * PAGE_SIZE], headers)
+
+    def reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def rest_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RESTHandler)
+    server.requests = []
+    server.since = []
+    server.issues = [rest_issue(number) for number in range(5, 0, -1)]
+    server.spent_tokens = set()
+    # Statuses returned by a page before it succeeds
+    server.failures = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def mine_rest(server, results_dir, tokens=("token",)):
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    (results_dir / "owner_proj").mkdir(exist_ok=True)
+    return asyncio.run(BugFixing.mine_projects(["owner_proj"], BugFixing.TokenPool(tokens), str(results_dir),
+                                               base_url, raise_errors=True))["owner_proj"]
+
+
+def test_rest_pages_and_rotates_spent_tokens(rest_server, clock, tmp_path):
+    rest_server.spent_tokens.add("spent")
+    issues = mine_rest(rest_server, tmp_path, ("spent", "fresh"))
+
+    assert [issue["number"] for issue in issues] == [5, 4, 3, 2, 1]
+    # Only the first request went to the spent token, every page was fetched once with the other one
+    assert rest_server.requests[0] == ("spent", 1)
+    assert sorted(rest_server.requests[1:]) == [("fresh", 1), ("fresh", 2), ("fresh", 3)]
+    # Another token was left, nothing waited for the reset
+    assert not clock.sleeps
+
+    with open(tmp_path / "owner_proj" / "proj_issues.json") as f:
+        assert json.load(f) == issues
+
+
+def test_rest_retries_server_errors(rest_server, clock, tmp_path):
+    rest_server.failures = {2: [502, 403]}
+    issues = mine_rest(rest_server, tmp_path)
+
+    assert [issue["number"] for issue in issues] == [5, 4, 3, 2, 1]
+    assert [page for _, page in rest_server.requests].count(2) == 3
+    assert clock.sleeps == [2, 4]
+
+
+def test_rest_page_failure_fails_the_project(rest_server, clock, tmp_path):
+    rest_server.failures = {3: [500] * (BugFixing.MAX_RETRIES + 1)}
+    with pytest.raises(Exception, match="status 500"):
+        mine_rest(rest_server, tmp_path)
+
+    # No partial issues file, nor a sync point to start the next run from
+    assert not (tmp_path / "owner_proj" / "proj_issues.json").exists()
+    assert not (tmp_path / "owner_proj" / "proj_issues_sync.json").exists()
+
+
+def test_rest_incremental_sync(rest_server, clock, tmp_path):
+    issues_file = tmp_path / "owner_proj" / "proj_issues.json"
+    sync_file = tmp_path / "owner_proj" / "proj_issues_sync.json"
+
+    # First run, every issue is fetched
+    assert len(mine_rest(rest_server, tmp_path)) == 5
+    assert set(rest_server.since) == {None}
+    with open(sync_file) as f:
+        assert json.load(f) == {"since": "2024-01-01T00:00:00Z", "etag": None}
+
+    # Issue 2 is updated and issue 6 is opened, only them are fetched and merged by id
+    rest_server.since.clear()
+    rest_server.issues = [rest_issue(6, "2024-03-01T00:00:00Z"), rest_issue(2, "2024-02-01T00:00:00Z")] + \
+        [rest_issue(number) for number in (5, 4, 3, 1)]
+    issues = mine_rest(rest_server, tmp_path)
+    assert [(issue["number"], issue["updated_at"][:7]) for issue in issues] == \
+        [(6, "2024-03"), (5, "2024-01"), (4, "2024-01"), (3, "2024-01"), (2, "2024-02"), (1, "2024-01")]
+    assert set(rest_server.since) == {"2024-01-01T00:00:00Z"}
+    with open(issues_file) as f:
+        assert json.load(f) == issues
+
+    # Sent again with the same since, the newest issue comes back and its ETag is stored
+    mine_rest(rest_server, tmp_path)
+    with open(sync_file) as f:
+        sync_state = json.load(f)
+    assert sync_state["since"] == "2024-03-01T00:00:00Z" and sync_state["etag"]
+
+    # Nothing changed, the 304 leaves both files untouched
+    rest_server.requests.clear()
+    contents = issues_file.read_bytes(), sync_file.read_bytes()
+    mtimes = issues_file.stat().st_mtime_ns, sync_file.stat().st_mtime_ns
+    assert mine_rest(rest_server, tmp_path) == issues
+    assert len(rest_server.requests) == 1
+    assert (issues_file.read_bytes(), sync_file.read_bytes()) == contents
+    assert (issues_file.stat().st_mtime_ns, sync_file.stat().st_mtime_ns) == mtimes
@@ -0,0 +1,27 @@
+import pytest
+
+from src import DiffMining
+from src.DiffMining import FIELD_SEPARATOR
+
+
+def test_numstat_record_keeps_files_with_the_same_name_apart():
+    stats = '\n'.join([
+        '',
+        '1\t2\tpom.xml',
+        '3\t0\tcore/pom.xml',
+        ' create mode 100644 core/pom.xml',
+    ])
+    record = FIELD_SEPARATOR.join(['a' * 40, 'b' * 40, 'dev', '2024-01-01T00:00:00+00:00', 'message', stats])
+
+    file_diffs = DiffMining.parse_numstat_record(record)['diff_stats']['file_diffs']
+    assert file_diffs == {
+        'pom.xml': {'change_type': 'MODIFY', 'lines_added': 1, 'lines_deleted': 2},
+        'core/pom.xml': {'change_type': 'ADD', 'lines_added': 3, 'lines_deleted': 0},
+    }
+
+
+def test_stats_only_rejects_diff_options(tmp_path):
+    with pytest.raises(ValueError):
+        DiffMining.find_repo_diff(str(tmp_path), str(tmp_path / 'results'), num_workers=4, stats_only=True)
+    with pytest.raises(ValueError):
+        DiffMining.find_repo_diff(str(tmp_path), str(tmp_path / 'results'), inline_diffs=True, stats_only=True)
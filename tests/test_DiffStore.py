@@ -0,0 +1,74 @@
+import os
+import json
+import subprocess
+import types
+
+import pytest
+
+from src import DiffMining, DiffStore
+
+
+def test_reads_diffs_appended_after_the_segment_was_mapped(tmp_path):
+    store = DiffStore.DiffSegmentWriter(str(tmp_path))
+    first = store.put("first diff")
+    store.flush()
+    assert DiffStore.read_diff(str(tmp_path), first) == "first diff"
+
+    # The segment grew since it was mapped
+    second = store.put("second diff" * 100)
+    store.flush()
+    assert DiffStore.read_diff(str(tmp_path), second) == "second diff" * 100
+
+    store.close()
+    assert DiffStore.find_diff(str(tmp_path), "0", second['sha1']) == second
+
+
+def test_resume_needs_the_checkpointed_segment(tmp_path):
+    with pytest.raises(Exception, match="missing"):
+        DiffStore.DiffSegmentWriter(str(tmp_path), resume_offset=10)
+
+
+def git_commits(path, count):
+    env = dict(os.environ, GIT_AUTHOR_NAME='dev', GIT_AUTHOR_EMAIL='dev@example.com',
+               GIT_COMMITTER_NAME='dev', GIT_COMMITTER_EMAIL='dev@example.com')
+    subprocess.run(['git', 'init', '-q', str(path)], check=True)
+    for i in range(count):
+        subprocess.run(['git', 'commit', '-q', '--allow-empty', '-m', str(i)], cwd=path, env=env, check=True)
+    log = subprocess.run(['git', 'log', '--reverse', '--format=%H'], cwd=path, capture_output=True, text=True, check=True)
+    return log.stdout.split()
+
+
+def test_missing_segment_starts_the_mining_over(tmp_path, monkeypatch):
+    monkeypatch.setattr(DiffMining, 'CHECKPOINT_INTERVAL', 1)
+    hashes = git_commits(tmp_path / 'repo', 3)
+    store_dir = str(tmp_path / 'diffs')
+    jsonl_path = str(tmp_path / 'CommitsDiff.jsonl')
+    checkpoint_path = str(tmp_path / 'CommitsDiff.checkpoint.json')
+
+    def analyze(commit, diff_store):
+        return {'commit_hash': commit.hash, 'diff': diff_store.put(f"diff of {commit.hash}")}
+
+    def traverse(resume_sha, stop=None):
+        start = hashes.index(resume_sha) + 1 if resume_sha else 0
+        for commit_hash in hashes[start:stop]:
+            yield types.SimpleNamespace(hash=commit_hash)
+
+    # Interrupted after two commits, the checkpoint is kept
+    def interrupted(resume_sha):
+        yield from traverse(resume_sha, 2)
+        raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        DiffMining.mine_commits(str(tmp_path / 'repo'), interrupted, jsonl_path, checkpoint_path, store_dir,
+                                analyze=analyze)
+    assert os.path.exists(checkpoint_path)
+
+    os.remove(DiffStore.segment_path(store_dir, "0"))
+    assert DiffMining.mine_commits(str(tmp_path / 'repo'), traverse, jsonl_path, checkpoint_path, store_dir,
+                                   analyze=analyze) == 3
+
+    # Every record points to its own diff in the new segment
+    with open(jsonl_path) as f:
+        records = [json.loads(line) for line in f]
+    assert [record['commit_hash'] for record in records] == hashes
+    for record in records:
+        assert DiffStore.read_diff(store_dir, record['diff']) == f"diff of {record['commit_hash']}"
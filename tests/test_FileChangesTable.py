@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from src import FileChangesTable
+
+
+def write_jsonl(path, records):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def record(commit_hash, file_diffs):
+    return {'commit_hash': commit_hash, 'diff_stats': {'file_diffs': file_diffs}}
+
+
+RECORDS = [
+    record('a' * 40, {'pom.xml': {'change_type': 'MODIFY', 'lines_added': 1, 'lines_deleted': 2},
+                      'core/pom.xml': {'change_type': 'ADD', 'lines_added': 3, 'lines_deleted': 0}}),
+    record('b' * 40, {'src/Main.java': {'change_type': 'RENAME', 'lines_added': 4, 'lines_deleted': 4}}),
+    record('c' * 40, {'old.txt': {'change_type': 'DELETE', 'lines_added': 0, 'lines_deleted': 7},
+                      'bin.dat': {'lines_added': 0, 'lines_deleted': 0}}),
+]
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+def test_export_in_several_batches(tmp_path, monkeypatch, fmt):
+    # Every batch holds a different set of change types
+    monkeypatch.setattr(FileChangesTable, 'BATCH_SIZE', 2)
+    write_jsonl(tmp_path / 'CommitsDiff.jsonl', RECORDS)
+    output = str(tmp_path / f'files.{fmt}')
+
+    assert FileChangesTable.export_file_changes(str(tmp_path / 'CommitsDiff.jsonl'), output, fmt)
+
+    rows = FileChangesTable.load_file_changes(output).to_pylist()
+    assert [(row['commit_hash'][0], row['path'], row['change_type'], row['lines_added'], row['lines_deleted'])
+            for row in rows] == [
+        ('a', 'pom.xml', 'MODIFY', 1, 2),
+        ('a', 'core/pom.xml', 'ADD', 3, 0),
+        ('b', 'src/Main.java', 'RENAME', 4, 4),
+        ('c', 'old.txt', 'DELETE', 0, 7),
+        ('c', 'bin.dat', 'UNKNOWN', 0, 0),
+    ]
+    assert not (tmp_path / f'files.{fmt}.tmp').exists()
+
+
+def test_failed_export_leaves_no_file(tmp_path):
+    with open(tmp_path / 'CommitsDiff.jsonl', 'w') as f:
+        f.write(json.dumps(RECORDS[0]) + '\n{not json\n')
+    output = str(tmp_path / 'files.arrow')
+
+    with pytest.raises(json.JSONDecodeError):
+        FileChangesTable.export_file_changes(str(tmp_path / 'CommitsDiff.jsonl'), output, 'arrow')
+    assert list(tmp_path.iterdir()) == [tmp_path / 'CommitsDiff.jsonl']
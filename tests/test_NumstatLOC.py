@@ -0,0 +1,42 @@
+import os
+import subprocess
+
+import pytest
+
+from src import NumstatLOC
+
+
+def git(repo, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME='dev', GIT_AUTHOR_EMAIL='dev@example.com',
+               GIT_COMMITTER_NAME='dev', GIT_COMMITTER_EMAIL='dev@example.com')
+    return subprocess.run(['git', *args], cwd=repo, env=env, check=True, capture_output=True, text=True).stdout
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    # The commit table lives in cache/ under the working directory
+    monkeypatch.chdir(tmp_path)
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    git(repo, 'init', '-q')
+    (repo / 'A.java').write_text('class A {}\n')
+    git(repo, 'add', '.')
+    git(repo, 'commit', '-q', '-m', 'first')
+    (repo / 'A.java').write_text('class A {\n    int a;\n}\n')
+    (repo / 'notes.txt').write_text('not counted\n')
+    git(repo, 'add', '.')
+    git(repo, 'commit', '-q', '-m', 'second')
+    return str(repo)
+
+
+def test_full_and_abbreviated_shas_give_the_same_tloc(repo):
+    head = git(repo, 'rev-parse', 'HEAD').strip()
+    parent = git(repo, 'rev-parse', 'HEAD^').strip()
+
+    tlocs = NumstatLOC.numstat_tlocs(repo, [head, head[:10]], {'Java'})
+    assert tlocs == {head: (2, parent), head[:10]: (2, parent)}
+
+
+def test_root_commit_is_left_out(repo):
+    root = git(repo, 'rev-parse', 'HEAD^').strip()
+    assert NumstatLOC.numstat_tlocs(repo, [root[:10]], {'Java'}) == {}
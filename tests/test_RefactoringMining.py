@@ -0,0 +1,93 @@
+import os
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from src import RefactoringMining
+
+
+def chunk(costs, num_chunks):
+    commits = [f"{i:040x}" for i in range(len(costs))]
+    chunks = RefactoringMining.balance_chunks(commits, dict(zip(commits, costs)), num_chunks)
+
+    # Contiguous, non-empty chunks covering every commit once
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(commits)
+    for (start, end, cost), (next_start, _, _) in zip(chunks, chunks[1:] + [(len(commits), None, None)]):
+        assert start < end == next_start
+        assert cost == sum(costs[start:end])
+    assert len(chunks) >= min(num_chunks, len(commits))
+    return chunks
+
+
+def test_even_costs_give_even_chunks():
+    chunks = chunk([200] * 1000, 10)
+    assert [end - start for start, end, _ in chunks] == [100] * 10
+
+
+def test_outlier_gets_its_own_chunk():
+    chunks = chunk([100000] + [200] * 999, 10)
+    assert len(chunks) == 10
+    assert chunks[0] == (0, 1, 100000)
+    # The other commits share the other chunks evenly
+    sizes = [end - start for start, end, _ in chunks[1:]]
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_outlier_in_the_middle():
+    chunks = chunk([200] * 500 + [10 ** 6] + [200] * 499, 10)
+    assert len(chunks) == 10
+    assert (500, 501, 10 ** 6) in chunks
+    costs = [cost for start, end, cost in chunks if (start, end) != (500, 501)]
+    assert max(costs) <= 1.3 * min(costs)
+
+
+def test_large_commit_that_is_not_an_outlier_is_balanced():
+    chunks = chunk([100000] + [200] * 999, 2)
+    costs = [cost for _, _, cost in chunks]
+    assert max(costs) <= 1.01 * min(costs)
+
+
+def test_several_outliers_next_to_each_other():
+    costs = [200] * 5 + [10 ** 6] * 3 + [200] * 3
+    chunks = chunk(costs, 10)
+    assert len(chunks) == 10
+    for i in range(5, 8):
+        assert (i, i + 1, 10 ** 6) in chunks
+
+
+def test_more_chunks_than_commits():
+    assert chunk([5, 10], 3) == [(0, 1, 5), (1, 2, 10)]
+
+
+def test_skewed_costs_never_lose_chunks():
+    rng = random.Random(0)
+    for _ in range(500):
+        costs = [int(200 * rng.paretovariate(1.1)) for _ in range(rng.randint(1, 80))]
+        chunk(costs, rng.randint(1, 100))
+
+
+def git_repo(path):
+    env = dict(os.environ, GIT_AUTHOR_NAME='dev', GIT_AUTHOR_EMAIL='dev@example.com',
+               GIT_COMMITTER_NAME='dev', GIT_COMMITTER_EMAIL='dev@example.com')
+    path.mkdir()
+    (path / 'A.java').write_text('class A {\n    void a() {}\n}\n')
+    for args in (['init', '-q'], ['add', '.'], ['commit', '-q', '-m', 'first']):
+        subprocess.run(['git', *args], cwd=path, env=env, check=True)
+    return str(path)
+
+
+def test_worker_check_fails_without_a_worker(tmp_path, monkeypatch):
+    # Nothing to compile the worker against, the worker mode falls back to the launcher
+    monkeypatch.setattr(RefactoringMining, 'get_refactoring_miner_dir', lambda: str(tmp_path / 'missing'))
+    monkeypatch.chdir(tmp_path)
+    assert not RefactoringMining.check_refactoring_miner_worker(git_repo(tmp_path / 'repo'))
+    assert RefactoringMining._worker is None
+
+
+@pytest.mark.skipif(shutil.which('javac') is None
+                    or not os.path.isdir(RefactoringMining.get_refactoring_miner_dir()),
+                    reason="needs a JDK and RefactoringMiner in the working directory")
+def test_worker_smoke(tmp_path):
+    assert RefactoringMining.check_refactoring_miner_worker(git_repo(tmp_path / 'repo'))
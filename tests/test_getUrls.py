@@ -0,0 +1,65 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src import getUrls
+
+
+class ProjectHandler(BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        self.server.requests.append(self.path)
+        status = self.server.statuses[self.path]
+        if isinstance(status, list):
+            status = status.pop(0)
+        self.send_response(status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ProjectHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+def test_only_definitive_statuses_are_cached(server, tmp_path):
+    server.statuses = {"/apache/found": 200, "/apache/gone": 404, "/apache/limited": [429, 200],
+                       "/apache/down": [503, 404]}
+    urls = [url(server, path) for path in server.statuses]
+    cache_file = str(tmp_path / "url_cache.json")
+
+    assert list(getUrls.check_urls(urls, cache_file, max_workers=2).values()) == [200, 404, 429, 503]
+    assert set(getUrls.load_url_cache(cache_file)) == {urls[0], urls[1]}
+
+    # Only the rate limited and failing urls are checked again
+    server.requests.clear()
+    assert list(getUrls.check_urls(urls, cache_file, max_workers=2).values()) == [200, 404, 200, 404]
+    assert sorted(server.requests) == ["/apache/down", "/apache/limited"]
+    assert len(getUrls.load_url_cache(cache_file)) == 4
+
+
+def test_expired_answer_is_kept_through_a_rate_limit(server, tmp_path):
+    server.statuses = {"/apache/found": [200, 429, 200]}
+    urls = [url(server, "/apache/found")]
+    cache_file = str(tmp_path / "url_cache.json")
+
+    assert getUrls.check_urls(urls, cache_file)[urls[0]] == 200
+    # Expired, the new check is rate limited
+    assert getUrls.check_urls(urls, cache_file, ttl=-1)[urls[0]] == 200
+    checked_at = getUrls.load_url_cache(cache_file)[urls[0]]["checked_at"]
+
+    assert getUrls.check_urls(urls, cache_file, ttl=-1)[urls[0]] == 200
+    assert getUrls.load_url_cache(cache_file)[urls[0]]["checked_at"] > checked_at
+    assert server.requests == ["/apache/found"] * 3